@@ -4,15 +4,21 @@ import pandas as pd
 import numpy as np
 from scipy.optimize import curve_fit
 import matplotlib.pyplot as plt
+import sys
+from pathlib import Path
 
-# load the parquet files from data_loader.py
-df = pd.concat([pd.read_parquet("dataset_part1.parquet"),pd.read_parquet("dataset_part2.parquet"),pd.read_parquet("dataset_part3.parquet")])
+sys.path.insert(0, str(Path(__file__).parent.parent / 'code'))
+from benchmark_cache import load_benchmark
+from qvar_bins import BinAccumulator
+
+# load the parquet files from data_loader.py, via a memory-mapped Arrow cache built on first run
+df = load_benchmark(columns=["ticker", "T", "z", "sigma"])
+#df = pd.concat([pd.read_parquet("dataset_part1.parquet"),pd.read_parquet("dataset_part2.parquet"),pd.read_parquet("dataset_part3.parquet")])
 
 # Select S&P 500, T=5
-# data = df[(df["ticker"] == "^GSPC") & (df["T"] == 5)].copy()
-# data = df[(df["ticker"] == "^GSPC") ].copy()
-data = df.copy()
-data["var"] = data.sigma**2
+# data = df[(df["ticker"] == "^GSPC") & (df["T"] == 5)]
+# data = df[(df["ticker"] == "^GSPC") ]
+data = df.assign(var=df.sigma**2)   # no deep copy: z and sigma stay backed by the mapped cache
 
 #print(f"S&P 500 T=5: {len(data)} windows")
 print(f"{len(data)} windows")
@@ -34,6 +40,9 @@ binned = (data.assign(z_bin=pd.cut(data.z, bins=bins, include_lowest=True))
 
 # zmid = (bins[0:(nbins-1)] + bins[1:(nbins)])/2
 
+# median and 25–75% band of the variance per bin, from quantile sketches filled in one pass
+quant = BinAccumulator(bins, sketch=True).update(data.z.to_numpy(), data["var"].to_numpy()).quantile_curve()
+
 def qvar(z, s0, zoff):    # define q-variance function, parameter is minimal volatility s0
     return (s0**2 + (z - zoff)**2 / 2)
 
@@ -54,6 +63,8 @@ string_array = [str(x) for x in numeric_array]
 #plt.scatter(data.z, data['var'], c='steelblue', alpha=numeric_array, s=1, edgecolor='none')
 #plt.scatter(data.z, data['var'], c=string_array, alpha=0.1, s=1, edgecolor='none')
 plt.plot(binned.z_mid, binned['var'], 'b-', lw=3)     # label='binned'
+plt.fill_between(quant.z_mid, quant.var_q25, quant.var_q75, color='orange', alpha=0.2, label='binned 25–75%')
+plt.plot(quant.z_mid, quant.var_q50, color='orange', lw=2, label='binned median')
 plt.plot(binned.z_mid, fitted, 'red', lw=3, label=f'σ₀ = {popt[0]:.3f}, zoff = {popt[1]:.3f}, R² = {r2:.3f}')
 
 plt.xlabel('z (scaled log return)', fontsize=12)
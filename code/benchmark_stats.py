@@ -0,0 +1,183 @@
+# benchmark_stats.py - precomputed sufficient statistics of the benchmark dataset
+# Per (ticker, T, fine z-bin): count, Σz, Σvar and Σvar². Binned curves, R², per-T
+# densities and any coarser bin scheme whose edges lie on the fine grid then come
+# from this small table in milliseconds instead of re-reading 3M rows
+#
+# usage: python code/benchmark_stats.py build    # write benchmark_stats.parquet
+#        python code/benchmark_stats.py verify   # recompute from the raw parquet parts and compare
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from benchmark_cache import BENCHMARK_PARTS
+from qvar_bins import BASELINE_POPT, BINS, bin_index, r2_score_binned
+
+STATS_VERSION = 1
+STATS_FILE = "benchmark_stats.parquet"
+ZLIM = 2.0
+
+# fine grid: 0.02 steps over ±2 (covers the notebook's 61 edges and the density
+# plot's 51 edges) merged with the scorer's 24 edges, whose spacing 1.2/23 is on
+# no decimal grid, plus an overflow bin at each end
+FINE_EDGES = np.unique(np.concatenate([
+    [-np.inf],
+    np.round(np.linspace(-ZLIM, ZLIM, 201), 10),
+    BINS,
+    [np.inf],
+]))
+
+
+def build_stats(df, edges=FINE_EDGES):
+    """Sufficient statistics of a window table (columns ticker, T, z, sigma) on the fine grid"""
+    z = df["z"].to_numpy(dtype=float)
+    var = df["sigma"].to_numpy(dtype=float)**2
+    tick_code, tickers = pd.factorize(df["ticker"], sort=True)
+    T_code, Ts = pd.factorize(df["T"], sort=True)
+    b = bin_index(z, edges)
+    # -inf edge: bin_index treats the lowest edge as included, so only NaN z is dropped here
+    ok = (b >= 0) & np.isfinite(var)
+
+    nb = len(edges) - 1
+    key = (tick_code[ok].astype(np.int64) * len(Ts) + T_code[ok]) * nb + b[ok]
+    keys, inv = np.unique(key, return_inverse=True)
+    stats = pd.DataFrame({
+        "ticker": np.asarray(tickers)[keys // (len(Ts) * nb)],
+        "T": np.asarray(Ts)[(keys // nb) % len(Ts)],
+        "bin": (keys % nb).astype(np.int32),
+        "count": np.bincount(inv).astype(np.int64),
+        "sum_z": np.bincount(inv, weights=z[ok]),
+        "sum_var": np.bincount(inv, weights=var[ok]),
+        "sum_var2": np.bincount(inv, weights=var[ok]**2),
+    })
+    stats.attrs["edges"] = tuple(float(e) for e in edges)
+    stats.attrs["source_rows"] = len(df)
+    return stats
+
+
+def write_stats(stats, path=STATS_FILE):
+    """Write the statistics with their version, fine edges and source row count in the metadata"""
+    table = pa.Table.from_pandas(stats, preserve_index=False)
+    meta = dict(table.schema.metadata or {})
+    meta[b"qvar_stats"] = json.dumps({
+        "version": STATS_VERSION,
+        "edges": list(stats.attrs["edges"]),
+        "source_rows": int(stats.attrs["source_rows"]),
+    }).encode()
+    pq.write_table(table.replace_schema_metadata(meta), path)
+
+
+def read_stats(path=STATS_FILE):
+    """Read a statistics artifact, checking its version"""
+    table = pq.read_table(path)
+    info = json.loads(table.schema.metadata[b"qvar_stats"])
+    if info["version"] != STATS_VERSION:
+        raise ValueError(f"{path} has version {info['version']}, expected {STATS_VERSION}; rebuild it")
+    stats = table.to_pandas()
+    stats.attrs["edges"] = tuple(info["edges"])
+    stats.attrs["source_rows"] = info["source_rows"]
+    return stats
+
+
+def coarse_map(fine_edges, edges):
+    """Coarse bin number of each fine bin (-1 outside); coarse edges must lie on the fine grid"""
+    fine_edges = np.asarray(fine_edges, dtype=float)
+    edges = np.asarray(edges, dtype=float)
+    pos = np.searchsorted(fine_edges, edges)
+    pos = np.clip(pos, 0, len(fine_edges) - 1)
+    near = np.where(np.abs(fine_edges[pos - 1] - edges) < np.abs(fine_edges[pos] - edges), pos - 1, pos)
+    if not np.allclose(fine_edges[near], edges, rtol=0, atol=1e-9):
+        bad = edges[~np.isclose(fine_edges[near], edges, rtol=0, atol=1e-9)]
+        raise ValueError(f"Bin edges {bad[:5]} are not on the fine grid; rebuild the statistics with them")
+    out = np.full(len(fine_edges) - 1, -1)
+    for k in range(len(edges) - 1):
+        out[near[k]:near[k + 1]] = k
+    return out
+
+
+def select(stats, tickers=None, horizons=None):
+    """Rows of the statistics for a subset of tickers and/or horizons"""
+    keep = np.ones(len(stats), dtype=bool)
+    if tickers is not None:
+        keep &= stats["ticker"].isin(list(tickers)).to_numpy()
+    if horizons is not None:
+        keep &= stats["T"].isin(list(horizons)).to_numpy()
+    return stats[keep]
+
+
+def rebin(stats, edges=BINS, tickers=None, horizons=None):
+    """Count, Σz, Σvar and Σvar² per coarse bin, summed over the selected tickers and horizons"""
+    sub = select(stats, tickers, horizons)
+    cmap = coarse_map(stats.attrs["edges"], edges)[sub["bin"].to_numpy()]
+    ok = cmap >= 0
+    nb = len(edges) - 1
+    return {col: np.bincount(cmap[ok], weights=sub[col].to_numpy()[ok], minlength=nb)
+            for col in ["count", "sum_z", "sum_var", "sum_var2"]}
+
+
+def binned_curve(stats, edges=BINS, tickers=None, horizons=None):
+    """The scorers' binned table (z_mid, var) plus count and var_se, from the statistics"""
+    s = rebin(stats, edges, tickers, horizons)
+    ok = s["count"] > 0
+    n = s["count"][ok]
+    mean = s["sum_var"][ok] / n
+    spread = np.clip(s["sum_var2"][ok] / n - mean**2, 0.0, None)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        se = np.where(n > 1, np.sqrt(spread / (n - 1)), np.nan)
+    return pd.DataFrame({"z_mid": s["sum_z"][ok] / n, "var": mean, "count": n.astype(np.int64), "var_se": se})
+
+
+def r2(stats, popt=BASELINE_POPT, edges=BINS, tickers=None, horizons=None):
+    """R² of the binned curve against the q-variance curve"""
+    return float(r2_score_binned(binned_curve(stats, edges, tickers, horizons), popt))
+
+
+def density(stats, edges=None, tickers=None, horizons=None):
+    """Histogram density of z, as np.histogram(z, bins=edges, density=True)"""
+    edges = np.linspace(-ZLIM, ZLIM, 51) if edges is None else np.asarray(edges)
+    counts = rebin(stats, edges, tickers, horizons)["count"]
+    return counts / (counts.sum() * np.diff(edges))
+
+
+def verify_stats(path=STATS_FILE, parts=BENCHMARK_PARTS, rtol=1e-9):
+    """Recompute the statistics from the raw parquet parts and compare with the artifact"""
+    stored = read_stats(path)
+    raw = pd.concat([pq.read_table(p, columns=["ticker", "T", "z", "sigma"]).to_pandas() for p in parts],
+                    ignore_index=True)
+    fresh = build_stats(raw, stored.attrs["edges"])
+
+    if stored.attrs["source_rows"] != len(raw):
+        print(f"❌ Row count differs: artifact {stored.attrs['source_rows']}, parquet {len(raw)}")
+        return False
+    keys = ["ticker", "T", "bin"]
+    a = stored.sort_values(keys).reset_index(drop=True)
+    b = fresh.sort_values(keys).reset_index(drop=True)
+    same = (len(a) == len(b)
+            and (a[keys].astype(str).to_numpy() == b[keys].astype(str).to_numpy()).all()
+            and (a["count"].to_numpy() == b["count"].to_numpy()).all()
+            and all(np.allclose(a[c], b[c], rtol=rtol, atol=0) for c in ["sum_z", "sum_var", "sum_var2"]))
+    print(f"{'✓' if same else '❌'} {path} {'matches' if same else 'does not match'} {len(raw)} raw rows")
+    return same
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "build":
+        raw = pd.concat([pq.read_table(p, columns=["ticker", "T", "z", "sigma"]).to_pandas()
+                         for p in BENCHMARK_PARTS], ignore_index=True)
+        stats = build_stats(raw)
+        write_stats(stats)
+        print(f"Wrote {len(stats)} (ticker, T, bin) cells from {len(raw)} windows to {STATS_FILE}")
+        print(f"R² = {r2(stats):.4f}")
+    elif command == "verify":
+        sys.exit(0 if verify_stats() else 1)
+    else:
+        print(f"Unknown command {command}; use build or verify")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
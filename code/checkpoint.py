@@ -0,0 +1,79 @@
+# checkpoint.py - periodic checkpoints for long simulations and dataset builds
+# A checkpoint directory holds a small state.json and numbered shards of the output
+# produced so far (.npy arrays or .parquet tables). Each save only writes the new shards,
+# then replaces state.json atomically, so a run killed at any moment resumes from the
+# last complete save. The state records a key of the run's settings and is ignored if a
+# later run has different settings
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+STATE_FILE = "state.json"
+
+
+class Checkpoint:
+    """
+    Resumable progress of one run.
+
+    key identifies the run (e.g. a JSON-able dict of its parameters); a
+    checkpoint written under another key is discarded rather than resumed.
+    """
+
+    def __init__(self, directory, key=None):
+        self.directory = Path(directory)
+        self.key = json.loads(json.dumps(key, sort_keys=True, default=str))
+        self.n_shards = 0
+
+    def load(self):
+        """
+        (state, shards) of the last save, or None if there is nothing to resume.
+
+        shards maps each name to the list of its shards, in save order.
+        """
+        path = self.directory / STATE_FILE
+        if not path.exists():
+            return None
+        saved = json.loads(path.read_text())
+        if saved["key"] != self.key:
+            print(f"⚠️  WARNING: Ignoring checkpoint in {self.directory} written with other settings")
+            self.clear()
+            return None
+        self.n_shards = saved["n_shards"]
+        shards = {}
+        for k, names in enumerate(saved["shards"]):
+            for name in names:
+                shards.setdefault(name, []).append(self._read(k, name))
+        return saved["state"], shards
+
+    def save(self, state, **shards):
+        """Write the new shards (arrays or DataFrames) and the state that goes with them"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / STATE_FILE
+        saved = json.loads(path.read_text()) if path.exists() else {"shards": []}
+        k = self.n_shards
+        for name, value in shards.items():
+            if isinstance(value, pd.DataFrame):
+                value.to_parquet(self.directory / f"{name}_{k:05d}.parquet", index=False)
+            else:
+                np.save(self.directory / f"{name}_{k:05d}.npy", np.asarray(value), allow_pickle=False)
+        saved = {"key": self.key, "state": state, "n_shards": k + 1,
+                 "shards": saved["shards"][:k] + [sorted(shards)]}
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(saved))
+        os.replace(tmp, path)   # shards beyond n_shards from a crashed save are overwritten later
+        self.n_shards = k + 1
+
+    def clear(self):
+        """Remove the checkpoint, e.g. once the run has finished"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.n_shards = 0
+
+    def _read(self, k, name):
+        npy = self.directory / f"{name}_{k:05d}.npy"
+        if npy.exists():
+            return np.load(npy, allow_pickle=False)
+        return pd.read_parquet(self.directory / f"{name}_{k:05d}.parquet")
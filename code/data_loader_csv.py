@@ -1,70 +1,40 @@
 # data_loader.py  reads in a CSV file, calculates variance over windows, and saves to parquet
-# reads prices from a column called "Price"
-import yfinance as yf
+# reads prices from a column called "Price" (one series, ticker "Model"), or many series from
+# either a long table with columns ticker, date, price or a wide table with a date column
+# followed by one price column per ticker. A file with Open, High, Low and Close columns
+# (one series, e.g. notebooks/indexSP1928.csv) uses Close as the price and also gets the
+# range-based volatilities sigma_pk, sigma_gk and sigma_rs of each window
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
-HORIZONS = 5*(np.arange(26)+1)   # does 1 to 26 weeks, can also do [5, 10, 20, 40, 80, 160]
-
-all_data = []
-TICKERS = ["Model"]
-for ticker in TICKERS:
-    df = pd.read_csv("variance_timeseries.csv")
-    price = df["Price"]
-    
-    ret = np.log(price).diff().dropna().values
-
-    rows = []
-    scale = np.sqrt(252)
-
-    for T in HORIZONS:
-        i = 0
-        while i + T <= len(ret):
-            window = ret[i:i+T]     # T points
-            if len(window) < T * 0.8:
-                break
-
-            x = window.sum()   # total price change over the period
-            sigma = np.std(window, ddof=0) * scale  # use np.std to get std over period, ddof=1 means divisor is N-1
-            z_raw = x / np.sqrt(T / 252.0)
-
-            # REJECT BAD WINDOWS
-            if not (np.isfinite(sigma) and sigma > 0 and np.isfinite(z_raw)):
-                i += T
-                continue
-
-            rows.append({          # append row of data for this period
-                "ticker": ticker,
-                "date": price.index[i + T - 1],   # row number
-                "T": T,
-                "z_raw": float(z_raw),
-                "sigma": float(sigma)
-            })
-            i += T
-
-    if not rows:
-        print(" [no data]")
-        continue
-
-    df = pd.DataFrame(rows)
-
-    # CLEAN BEFORE DE-MEANING 
-    df = df[np.isfinite(df['z_raw']) & np.isfinite(df['sigma']) & (df['sigma'] > 0)]
-
-    # NOW de-mean safely, this step groups by ticker and T, and subtracts the group mean 
-    df["z"] = df.groupby(["ticker", "T"])["z_raw"].transform(lambda g: g - g.mean())
-
-    df = df.drop(columns="z_raw")
-    df = df.dropna().reset_index(drop=True)  # Final clean
-
-    print(f" → {len(df)} clean windows")
-    all_data.append(df)
-
-full = pd.concat(all_data, ignore_index=True)
+from window_engine import COLUMNS, compute_panel_windows
 
+HORIZONS = 5*(np.arange(26)+1)   # does 1 to 26 weeks, can also do [5, 10, 20, 40, 80, 160]
 
-n = len(full) // 3
+df = pd.read_csv("variance_timeseries.csv")
+ohlc = None
+
+if {"Open", "High", "Low", "Close"} <= set(df.columns):
+    # single OHLC series: the date is the first column if it is not a price
+    dates = df[df.columns[0]] if df.columns[0] not in ("Open", "High", "Low", "Close") else df.index
+    prices = pd.DataFrame({"ticker": "Model", "date": dates, "price": df["Close"],
+                           "open": df["Open"], "high": df["High"], "low": df["Low"]})
+    ohlc = ("open", "high", "low")
+elif "Price" in df.columns:
+    # single series: the date is the row number
+    prices = pd.DataFrame({"ticker": "Model", "date": df.index, "price": df["Price"]})
+elif {"ticker", "date", "price"} <= set(df.columns):
+    prices = df
+else:
+    prices = df.set_index(df.columns[0])
+
+# all tickers in one segmented pass; bad windows are rejected and z is de-meaned per (ticker, T)
+full = compute_panel_windows(prices, horizons=HORIZONS, ohlc=ohlc)
+full = full.dropna(subset=COLUMNS).reset_index(drop=True)  # Final clean; range columns may be NaN
+
+for ticker, n in full.groupby("ticker", sort=False).size().items():
+    print(f"{ticker} → {n} clean windows")
 
 # Save to file
 full.to_parquet("dataset.parquet", compression=None)
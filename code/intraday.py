@@ -0,0 +1,178 @@
+# intraday.py - streams intraday bars or ticks and aggregates them to daily data
+# Each chunk of a large CSV or parquet file is reduced to per-(ticker, day) closes and
+# realized variance as it is read, so only the daily table is ever held in memory. The
+# daily table then goes through the usual window computation, with sigma either the std
+# of the daily returns (as for daily closes) or the intraday realized volatility
+#
+# usage: python code/intraday.py bars.parquet [--realized] [--ticker NAME]
+#   the file needs columns timestamp and price (and ticker, unless --ticker is given);
+#   rows of each ticker in time order. Writes dataset.parquet as data_loader_csv.py does
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from window_engine import HORIZONS, compute_panel_windows
+
+CHUNK_ROWS = 1_000_000
+DAILY_COLUMNS = ["ticker", "date", "close", "rv", "n_bars"]
+
+
+def read_chunks(path, columns=None, chunk_rows=CHUNK_ROWS):
+    """DataFrames of at most chunk_rows rows from a CSV or parquet file"""
+    if Path(path).suffix == ".parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_rows)
+
+
+class DailyAggregator:
+    """
+    Per-(ticker, day) close and realized variance from intraday prices fed in chunks.
+
+    Rows of each ticker must arrive in time order; tickers may be interleaved.
+    The realized variance of a day is the sum of its squared intraday log
+    returns, excluding the overnight return from the previous close unless
+    include_overnight is set. A day is emitted once a later day of the same
+    ticker is seen, the last day of each ticker by finish().
+    """
+
+    def __init__(self, include_overnight=False):
+        self.include_overnight = include_overnight
+        self._last = {}      # ticker -> (log price, day) of its latest row
+        self._pending = {}   # ticker -> [day, close, rv, n_bars] of its open day
+        self._done = []      # completed days, one DataFrame per chunk
+
+    def update(self, ticker, time, price):
+        """Add a chunk of rows"""
+        ticker = np.asarray(ticker, dtype=object)
+        day = pd.DatetimeIndex(pd.to_datetime(time)).normalize().to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            logp = np.log(np.asarray(price, dtype=float))
+        ok = np.isfinite(logp)   # drop bad ticks
+        ticker, day, logp = ticker[ok], day[ok], logp[ok]
+        if len(logp) == 0:
+            return self
+
+        codes, names = pd.factorize(ticker, sort=False)
+        order = np.argsort(codes, kind='stable')
+        codes, day, logp = codes[order], day[order], logp[order]
+        first = np.r_[True, codes[1:] != codes[:-1]]
+        starts = np.flatnonzero(first)
+
+        # previous row of each row, carried over from earlier chunks at ticker starts
+        prev_logp = np.r_[np.nan, logp[:-1]]
+        prev_day = np.r_[day[:1], day[:-1]]
+        has_prev = ~first
+        for s, name in zip(starts, names[codes[starts]]):
+            if name in self._last:
+                prev_logp[s], prev_day[s] = self._last[name]
+                has_prev[s] = True
+        ends = np.r_[starts[1:], len(codes)] - 1
+        for e, name in zip(ends, names[codes[ends]]):
+            self._last[name] = (logp[e], day[e])
+
+        r = logp - prev_logp
+        same_day = has_prev & (day == prev_day)
+        use = has_prev & (same_day | self.include_overnight)
+        contrib = np.where(use, r, 0.0)**2
+
+        # consecutive rows of one ticker and day form a group
+        new_group = first | (day != np.r_[day[:1], day[:-1]])
+        gid = np.cumsum(new_group) - 1
+        gstart = np.flatnonzero(new_group)
+        gend = np.r_[gstart[1:], len(codes)] - 1
+        g = pd.DataFrame({
+            "ticker": names[codes[gstart]],
+            "date": day[gstart],
+            "close": logp[gend],
+            "rv": np.bincount(gid, weights=contrib),
+            "n_bars": np.bincount(gid),
+        })
+
+        # join each ticker's first group to its pending day; its last group becomes pending
+        gfirst = np.r_[True, g["ticker"].to_numpy()[1:] != g["ticker"].to_numpy()[:-1]]
+        glast = np.r_[gfirst[1:], True]
+        carried = []
+        for i in np.flatnonzero(gfirst):
+            name = g.at[i, "ticker"]
+            pend = self._pending.pop(name, None)
+            if pend is None:
+                continue
+            if pend[0] == g.at[i, "date"]:
+                g.at[i, "rv"] += pend[2]
+                g.at[i, "n_bars"] += pend[3]
+            else:
+                carried.append([name] + pend)
+        for i in np.flatnonzero(glast):
+            self._pending[g.at[i, "ticker"]] = [g.at[i, "date"], g.at[i, "close"], g.at[i, "rv"], g.at[i, "n_bars"]]
+
+        if carried:
+            self._done.append(pd.DataFrame(carried, columns=DAILY_COLUMNS))
+        self._done.append(g[~glast])
+        return self
+
+    def finish(self):
+        """Daily table (ticker, date, log close, rv, n_bars), tickers in order of first appearance"""
+        rest = [[name] + pend for name, pend in self._pending.items()]
+        self._pending = {}
+        if rest:
+            self._done.append(pd.DataFrame(rest, columns=DAILY_COLUMNS))
+        if not self._done:
+            return pd.DataFrame(columns=DAILY_COLUMNS)
+        daily = pd.concat(self._done, ignore_index=True)
+        self._done = [daily]
+
+        tick_order = {name: i for i, name in enumerate(self._last)}
+        key = daily["ticker"].map(tick_order).to_numpy()
+        order = np.lexsort((daily["date"].to_numpy(), key))
+        return daily.iloc[order].reset_index(drop=True)
+
+
+def aggregate_intraday(path, ticker=None, time="timestamp", price="price", chunk_rows=CHUNK_ROWS,
+                       include_overnight=False):
+    """
+    Daily table of an intraday file, read chunk by chunk.
+
+    If ticker is None the file must have a ticker column; otherwise all rows
+    belong to the series of that name.
+    """
+    columns = [time, price] + (["ticker"] if ticker is None else [])
+    agg = DailyAggregator(include_overnight)
+    for chunk in read_chunks(path, columns, chunk_rows):
+        names = chunk["ticker"] if ticker is None else np.full(len(chunk), ticker, dtype=object)
+        agg.update(names, chunk[time], chunk[price])
+    return agg.finish()
+
+
+def intraday_windows(daily, horizons=HORIZONS, realized=False):
+    """
+    Window table of a daily table from DailyAggregator.
+
+    With realized=False the windows are those of the daily closes; with
+    realized=True sigma is the realized volatility of the window's days.
+    """
+    return compute_panel_windows(daily, horizons=horizons, price="close", log_prices=True,
+                                 variance="rv" if realized else None)
+
+
+def main():
+    args = sys.argv[1:]
+    realized = "--realized" in args
+    ticker = args[args.index("--ticker") + 1] if "--ticker" in args else None
+    path = [a for a in args if not a.startswith("--") and a != ticker][0]
+
+    daily = aggregate_intraday(path, ticker=ticker)
+    print(f"{len(daily)} ticker-days from {daily['n_bars'].sum()} rows")
+    full = intraday_windows(daily, realized=realized)
+    full = full.dropna().reset_index(drop=True)  # Final clean
+    print(f"{len(full)} clean windows ({'realized' if realized else 'close-to-close'} sigma)")
+    full.to_parquet("dataset.parquet", compression=None)
+    print("Done! 1 file created")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# models.py - registry of reference price models with batched simulation kernels
+# A model is a kernel that maps (n_days, n_paths, rng, **params) to a 2-D array of daily
+# log prices, one row per path, all paths simulated at once with NumPy array operations.
+# Registered models plug straight into the window engine and the scorer, so trying a
+# new parameter set is one call instead of a hand-written simulation loop
+#
+# usage: python code/models.py                          # list the models
+#        python code/models.py gbm sigma=0.3 [--days N] [--paths P] [--seed S]
+import sys
+
+import numpy as np
+from scipy.signal import lfilter
+
+from rough_vol import simulate_rough_bergomi
+from window_engine import HORIZONS, windows_from_price_paths
+
+MODELS = {}    # name -> (kernel, default parameters)
+DT = 1.0 / 252.0
+
+
+def register(name, **defaults):
+    """
+    Decorator adding a kernel to the registry under name.
+
+    The kernel is called as kernel(n_days, n_paths, rng, **params) and must
+    return log prices of shape (n_paths, n_days + 1) starting at 0; defaults
+    are the parameters used when a caller leaves them out.
+    """
+    def wrap(kernel):
+        MODELS[name] = (kernel, defaults)
+        return kernel
+    return wrap
+
+
+def get_model(name):
+    """(kernel, default parameters) of a registered model"""
+    if name not in MODELS:
+        raise ValueError(f"Unknown model {name!r}; registered models: {', '.join(sorted(MODELS))}")
+    return MODELS[name]
+
+
+def simulate_log_paths(model, params=None, n_days=252, n_paths=1, seed=None):
+    """Daily log prices of shape (n_paths, n_days + 1) of a registered model"""
+    kernel, defaults = get_model(model)
+    unknown = set(params or {}) - set(defaults)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {model}: {', '.join(sorted(unknown))}")
+    return kernel(n_days, n_paths, np.random.default_rng(seed), **{**defaults, **(params or {})})
+
+
+def model_windows(model, params=None, n_days=252, n_paths=1, seed=None, horizons=HORIZONS):
+    """Window table of simulated paths, each path a ticker named model_0, model_1, ..."""
+    paths = simulate_log_paths(model, params, n_days, n_paths, seed)
+    return windows_from_price_paths({f"{model}_{i}": p for i, p in enumerate(paths)}, horizons)
+
+
+def model_simulator(model):
+    """
+    Single-path simulator of a registered model for run_pipeline / run_adaptive.
+
+    The returned function is called as simulator(n_days=..., seed=..., **params)
+    and gives daily prices.
+    """
+    def simulator(n_days=252, seed=None, **params):
+        return np.exp(simulate_log_paths(model, params, n_days, 1, seed)[0])
+    simulator.__name__ = f"{model}_simulator"
+    return simulator
+
+
+def _prepend_zero(dL):
+    """Log prices from increments, starting at 0"""
+    L = np.zeros((dL.shape[0], dL.shape[1] + 1))
+    np.cumsum(dL, axis=1, out=L[:, 1:])
+    return L
+
+
+# Reference models. mu is the drift of the log price per year throughout, as in the
+# regime mixture model, so that long series stay in range when exponentiated
+
+@register("gbm", sigma=0.25, mu=0.0)
+def gbm_kernel(n_days, n_paths, rng, sigma, mu):
+    """Constant volatility: ΔL = μ dt + σ √dt ε"""
+    return _prepend_zero(mu * DT + sigma * np.sqrt(DT) * rng.standard_normal((n_paths, n_days)))
+
+
+@register("two_factor", sigma_f=0.2, sigma_n=0.1, mu=0.0)
+def two_factor_kernel(n_days, n_paths, rng, sigma_f, sigma_n, mu):
+    """
+    Two-factor Gaussian diffusion of simu.ai's simulate_price_path: the log
+    price is the sum of a fundamental and a noise Brownian motion.
+    """
+    xi = rng.standard_normal((2, n_paths, n_days))
+    return _prepend_zero(mu * DT + np.sqrt(DT) * (sigma_f * xi[0] + sigma_n * xi[1]))
+
+
+@register("heston", kappa=2.0, theta=0.0625, xi=0.5, rho=-0.7, v0=None, mu=0.0, steps_per_day=1)
+def heston_kernel(n_days, n_paths, rng, kappa, theta, xi, rho, v0, mu, steps_per_day):
+    """
+    Heston stochastic variance, full-truncation Euler scheme:
+
+        ΔL = μ dt + √(v⁺ dt) ε₁
+        Δv = κ(θ - v⁺) dt + ξ √(v⁺ dt) (ρ ε₁ + √(1 - ρ²) ε₂)
+
+    with v⁺ = max(v, 0) and v0 = θ if not given. The variance recursion is
+    sequential in time, so the loop runs over steps with every path updated
+    at once: simulate many paths rather than one long one.
+    """
+    dt = DT / steps_per_day
+    v = np.full(n_paths, theta if v0 is None else v0, dtype=float)
+    L = np.zeros((n_paths, n_days + 1))
+    x = np.zeros(n_paths)
+    c = np.sqrt(1.0 - rho**2)
+    block = max(1, 65536 // max(n_paths, 1))   # days of normals drawn at a time
+    for d0 in range(0, n_days, block):
+        nd = min(block, n_days - d0)
+        eps = rng.standard_normal((2, nd * steps_per_day, n_paths))
+        for k in range(nd * steps_per_day):
+            vp = np.maximum(v, 0.0)
+            sq = np.sqrt(vp * dt)
+            x += mu * dt + sq * eps[0, k]
+            v += kappa * (theta - vp) * dt + xi * sq * (rho * eps[0, k] + c * eps[1, k])
+            if (k + 1) % steps_per_day == 0:
+                L[:, d0 + (k + 1) // steps_per_day] = x
+    return L
+
+
+@register("regime_mixture", sigma0=0.2586, mu=0.0, mean_regime_length_days=1300.0,
+          mean_reversion_rate=0.001, samples_per_day=4)
+def regime_mixture_kernel(n_days, n_paths, rng, sigma0, mu, mean_regime_length_days,
+                          mean_reversion_rate, samples_per_day):
+    """
+    simu.ai's regime mixture model without the step loop: regime lengths are
+    geometric, each regime has V = 1/τ with τ ~ Gamma(3/2, rate=σ₀²), and
+
+        L[t+1] = L[t] + μ dt - θ L[t] dt + √(V dt) ε
+
+    The switches of all paths are laid out at once, and the mean-reverting
+    recursion, which is linear, runs as one IIR filter along the time axis.
+    """
+    dt = DT / samples_per_day
+    n_steps = n_days * samples_per_day
+    p_switch = 1.0 / (mean_regime_length_days * samples_per_day)
+
+    # regime number of every step: a regime starts after each cumulative length
+    n_reg = int(1.2 * n_steps * p_switch) + 8
+    lengths = rng.geometric(p_switch, (n_paths, n_reg))
+    while lengths.sum(axis=1).min() < n_steps:
+        lengths = np.hstack([lengths, rng.geometric(p_switch, (n_paths, n_reg))])
+    starts = np.cumsum(lengths, axis=1)
+    switch = np.zeros((n_paths, n_steps + 1), dtype=np.int32)
+    rows, cols = np.nonzero(starts < n_steps)
+    switch[rows, starts[rows, cols]] = 1
+    regime = np.cumsum(switch[:, :n_steps], axis=1)
+
+    V = 1.0 / rng.gamma(1.5, 1.0 / sigma0**2, lengths.shape)
+    dL = mu * dt + np.sqrt(np.take_along_axis(V, regime, axis=1) * dt) * rng.standard_normal((n_paths, n_steps))
+    L = np.zeros((n_paths, n_steps + 1))
+    L[:, 1:] = lfilter([1.0], [1.0, -(1.0 - mean_reversion_rate * dt)], dL, axis=1)
+    return L[:, ::samples_per_day]
+
+
+@register("rough_bergomi", H=0.07, eta=1.3, rho=-0.2, xi=0.32**2)
+def rough_bergomi_kernel(n_days, n_paths, rng, H, eta, rho, xi):
+    """Rough Bergomi (code/rough_vol.py), the model of the grok_rough_vol entry"""
+    prices, _ = simulate_rough_bergomi(H, eta, rho, xi, n_days=n_days, n_paths=n_paths,
+                                       seed=rng.integers(2**63))
+    return np.log(prices)
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        for name, (kernel, defaults) in sorted(MODELS.items()):
+            print(f"{name}: {', '.join(f'{k}={v}' for k, v in defaults.items())}")
+        return
+
+    from qvar_pipeline import score_windows
+
+    options = {k: int(args[args.index(k) + 1]) for k in ["--days", "--paths", "--seed"] if k in args}
+    params = {}
+    for a in args[1:]:
+        if "=" in a:
+            k, v = a.split("=")
+            params[k] = int(v) if v.lstrip("-").isdigit() else float(v)
+    windows = model_windows(args[0], params, n_days=options.get("--days", 252 * 100),
+                            n_paths=options.get("--paths", 100), seed=options.get("--seed"))
+    result = score_windows(windows)
+    print(f"{args[0]}: {len(windows)} windows, R² = {result['r2']:.4f} ({result['status']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# qvar_bins.py - running per-bin accumulators for the binned q-variance curve
+# Reproduces the pd.cut(..., include_lowest=True) / groupby binning of the scorers
+# without holding the windows, so that blocks of windows can be added one at a time;
+# optional per-bin quantile sketches give median curves in the same bounded memory
+import numpy as np
+import pandas as pd
+
+ZMAX = 0.6
+DELZ = 0.025*2
+NBINS = int(2*ZMAX/DELZ + 1)
+BINS = np.linspace(-ZMAX, ZMAX, NBINS)     # fixed bins, as in score_submission.py
+BASELINE_POPT = [0.2586, 0.0214]           # baseline fit parameters (σ₀, zoff)
+R2_THRESHOLD = 0.995
+
+
+def qvar(z, s0, zoff):
+    """Q-variance function: σ²(z) = σ₀² + (z - z₀)²/2"""
+    return (s0**2 + (z - zoff)**2 / 2)
+
+
+def bin_index(z, bins=BINS):
+    """Bin number of each z for right-closed bins with the lowest edge included, -1 if outside"""
+    z = np.asarray(z, dtype=float)
+    idx = np.searchsorted(bins, z, side='left') - 1
+    idx[z == bins[0]] = 0
+    idx[(idx < 0) | (idx >= len(bins) - 1) | ~np.isfinite(z)] = -1
+    return idx
+
+
+def r2_score_binned(binned, popt=BASELINE_POPT):
+    """R² of the binned average variance against the q-variance curve"""
+    fitted = qvar(binned.z_mid, popt[0], popt[1])
+    return 1 - np.sum((binned["var"] - fitted)**2) / np.sum((binned["var"] - binned["var"].mean())**2)
+
+
+class BinQuantileSketch:
+    """
+    Mergeable quantile sketch of the variance in each z-bin.
+
+    Variances are counted in logarithmically spaced buckets (as in DDSketch),
+    so every quantile is returned to within a relative error rel_accuracy,
+    memory is fixed per bin whatever the number of windows, updates are one
+    bincount, and sketches of different shards merge exactly by adding counts.
+    Values outside [vmin, vmax] are clamped into the end buckets.
+    """
+
+    def __init__(self, bins=BINS, rel_accuracy=0.01, vmin=1e-8, vmax=1e4):
+        self.bins = np.asarray(bins, dtype=float)
+        self.rel_accuracy = float(rel_accuracy)
+        self.gamma = (1 + self.rel_accuracy) / (1 - self.rel_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.offset = int(np.ceil(np.log(vmin) / self.log_gamma))
+        self.n_buckets = int(np.ceil(np.log(vmax) / self.log_gamma)) - self.offset + 1
+        self.counts = np.zeros((len(self.bins) - 1, self.n_buckets), dtype=np.int64)
+
+    def update(self, z, var):
+        """Add windows with scaled log return z and variance var"""
+        idx = bin_index(z, self.bins)
+        var = np.asarray(var, dtype=float)
+        ok = (idx >= 0) & (var > 0) & np.isfinite(var)
+        bucket = np.ceil(np.log(var[ok]) / self.log_gamma).astype(np.int64) - self.offset
+        bucket = np.clip(bucket, 0, self.n_buckets - 1)
+        flat = idx[ok] * self.n_buckets + bucket
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+        return self
+
+    def merge(self, other):
+        """Combine with the sketch of another shard with the same bins and buckets"""
+        if (not np.array_equal(self.bins, other.bins) or self.gamma != other.gamma
+                or self.offset != other.offset or self.n_buckets != other.n_buckets):
+            raise ValueError("Cannot merge sketches with different bins or buckets")
+        self.counts += other.counts
+        return self
+
+    def quantile(self, q):
+        """Variance quantile(s) q of every bin, shape (len(q), bins); NaN for empty bins"""
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        cum = np.cumsum(self.counts, axis=1)
+        total = cum[:, -1]
+        out = np.full((len(q), len(total)), np.nan)
+        for i, qi in enumerate(q):
+            # rank as in np.quantile(..., method='lower')
+            rank = np.floor(qi * (total - 1))
+            k = (cum <= rank[:, None]).sum(axis=1)
+            value = 2 * self.gamma**(k + self.offset) / (self.gamma + 1)
+            out[i] = np.where(total > 0, value, np.nan)
+        return out
+
+
+class BinAccumulator:
+    """
+    Counts, Σz, Σvar and Σvar² per z-bin.
+
+    Feed windows with update() as they are produced; binned() then gives the
+    same z_mid / var table as the pd.cut + groupby in score_submission.py,
+    plus the count and standard error of each bin mean. With sketch=True a
+    BinQuantileSketch is filled in the same pass, and quantile_curve() gives
+    the median and quantile bands of the variance, which unlike the mean are
+    not dominated by the few extreme windows in the tail bins.
+    """
+
+    def __init__(self, bins=BINS, sketch=False):
+        self.bins = np.asarray(bins, dtype=float)
+        nb = len(self.bins) - 1
+        self.count = np.zeros(nb, dtype=np.int64)
+        self.sum_z = np.zeros(nb)
+        self.sum_var = np.zeros(nb)
+        self.sum_var2 = np.zeros(nb)
+        self.sketch = BinQuantileSketch(self.bins) if sketch else None
+
+    def update(self, z, var):
+        """Add windows with scaled log return z and variance var (= sigma²)"""
+        idx = bin_index(z, self.bins)
+        ok = idx >= 0
+        idx = idx[ok]
+        var = np.asarray(var, dtype=float)[ok]
+        nb = len(self.count)
+        self.count += np.bincount(idx, minlength=nb)
+        self.sum_z += np.bincount(idx, weights=np.asarray(z, dtype=float)[ok], minlength=nb)
+        self.sum_var += np.bincount(idx, weights=var, minlength=nb)
+        self.sum_var2 += np.bincount(idx, weights=var**2, minlength=nb)
+        if self.sketch is not None:
+            self.sketch.update(np.asarray(z, dtype=float)[ok], var)
+        return self
+
+    def merge(self, other):
+        """Combine with the accumulator of another shard using the same bins"""
+        if not np.array_equal(self.bins, other.bins):
+            raise ValueError("Cannot merge accumulators with different bins")
+        self.count += other.count
+        self.sum_z += other.sum_z
+        self.sum_var += other.sum_var
+        self.sum_var2 += other.sum_var2
+        if self.sketch is not None:
+            if other.sketch is None:
+                raise ValueError("Cannot merge an accumulator without a sketch into one with a sketch")
+            self.sketch.merge(other.sketch)
+        return self
+
+    def binned(self):
+        """
+        Per-bin mean z and mean variance, empty bins dropped.
+
+        var_se is the standard error of each bin mean assuming independent
+        windows; windows from one path are correlated, so for an honest error
+        on R² use jackknife_r2 over independent blocks.
+        """
+        ok = self.count > 0
+        n = self.count[ok]
+        mean = self.sum_var[ok] / n
+        spread = np.clip(self.sum_var2[ok] / n - mean**2, 0.0, None)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            se = np.sqrt(spread / (n - 1))
+        return pd.DataFrame({
+            "z_mid": self.sum_z[ok] / n,
+            "var": mean,
+            "count": n,
+            "var_se": np.where(n > 1, se, np.nan),
+        })
+
+    def quantile_curve(self, quantiles=(0.1, 0.25, 0.5, 0.75, 0.9)):
+        """
+        Per-bin mean z and variance quantiles, empty bins dropped.
+
+        Columns are z_mid and var_q10, var_q25, ... for each quantile, so the
+        median curve is var_q50. Needs an accumulator created with sketch=True.
+        """
+        if self.sketch is None:
+            raise ValueError("quantile_curve needs BinAccumulator(..., sketch=True)")
+        ok = self.count > 0
+        values = self.sketch.quantile(quantiles)[:, ok]
+        out = pd.DataFrame({"z_mid": self.sum_z[ok] / self.count[ok]})
+        for q, v in zip(quantiles, values):
+            out[f"var_q{round(100 * q):02d}"] = v
+        return out
+
+
+class SortedZIndex:
+    """
+    Windows sorted once by z, with prefix sums of z, var and var².
+
+    Any set of bin edges then costs two searchsorted calls and a few
+    differences, O(bins log n), instead of a pd.cut over every window, so
+    bin-sensitivity scans and interactive re-binning are essentially free
+    after the first sort. Bins follow the same right-closed convention as
+    bin_index.
+    """
+
+    def __init__(self, z, var):
+        z = np.asarray(z, dtype=float)
+        var = np.asarray(var, dtype=float)
+        ok = np.isfinite(z) & np.isfinite(var)
+        order = np.argsort(z[ok], kind='stable')
+        self.z = z[ok][order]
+        var = var[ok][order]
+        self.cum_z = np.concatenate([[0.0], np.cumsum(self.z)])
+        self.cum_var = np.concatenate([[0.0], np.cumsum(var)])
+        self.cum_var2 = np.concatenate([[0.0], np.cumsum(var**2)])
+
+    def accumulator(self, bins=BINS):
+        """BinAccumulator holding the windows binned on the given edges"""
+        bins = np.asarray(bins, dtype=float)
+        # number of windows with z <= edge; the lowest edge is included in the first bin
+        pos = np.searchsorted(self.z, bins, side='right')
+        pos[0] = np.searchsorted(self.z, bins[0], side='left')
+        acc = BinAccumulator(bins)
+        acc.count = np.diff(pos).astype(np.int64)
+        acc.sum_z = np.diff(self.cum_z[pos])
+        acc.sum_var = np.diff(self.cum_var[pos])
+        acc.sum_var2 = np.diff(self.cum_var2[pos])
+        return acc
+
+    def binned(self, bins=BINS):
+        """Same table as BinAccumulator.binned() for the given edges"""
+        return self.accumulator(bins).binned()
+
+
+def jackknife_r2(accumulators, popt=BASELINE_POPT):
+    """
+    R² of the pooled accumulators and its delete-one-block jackknife standard error.
+
+    Each accumulator should hold an independent block (e.g. a separately seeded
+    simulation chunk), so correlation between windows inside a block is
+    accounted for in the error.
+    """
+    total = BinAccumulator(accumulators[0].bins)
+    for acc in accumulators:
+        total.merge(acc)
+    r2 = r2_score_binned(total.binned(), popt)
+
+    n = len(accumulators)
+    if n < 2:
+        return r2, np.nan
+    loo = np.empty(n)
+    for b, acc in enumerate(accumulators):
+        rest = BinAccumulator(total.bins)
+        rest.count = total.count - acc.count
+        rest.sum_z = total.sum_z - acc.sum_z
+        rest.sum_var = total.sum_var - acc.sum_var
+        rest.sum_var2 = total.sum_var2 - acc.sum_var2
+        loo[b] = r2_score_binned(rest.binned(), popt)
+    se = np.sqrt((n - 1) / n * np.sum((loo - loo.mean())**2))
+    return r2, se
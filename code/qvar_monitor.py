@@ -0,0 +1,215 @@
+# qvar_monitor.py - online q-variance state, updated one daily price at a time
+# Keeps, per ticker and horizon, the window in progress, the running sums that de-mean z
+# and per-cell variance sums on a fine grid of raw z. A new price costs O(#horizons);
+# the binned curve, R² and (σ₀, zoff) can be read off at any time, and the state
+# round-trips through a small compressed .npz between runs
+import numpy as np
+
+from qvar_bins import BASELINE_POPT, BINS, BinAccumulator, bin_index, r2_score_binned
+from window_engine import HORIZONS, SCALE
+
+MONITOR_VERSION = 1
+ZLIM = 1.0    # fine grid of raw z covers ±ZLIM, plus one overflow cell each side
+DZ = 0.01
+
+
+class TickerState:
+    """Window and accumulator state of one ticker, one row per horizon"""
+
+    def __init__(self, n_horizons, n_cells):
+        self.last_logp = np.nan
+        self.k = np.zeros(n_horizons, dtype=np.int64)       # returns in the current window
+        self.s1 = np.zeros(n_horizons)                      # Σr of the current window
+        self.s2 = np.zeros(n_horizons)                      # Σr² of the current window
+        self.n_win = np.zeros(n_horizons, dtype=np.int64)   # kept windows, for de-meaning
+        self.sum_zraw = np.zeros(n_horizons)
+        self.count = np.zeros((n_horizons, n_cells), dtype=np.int64)
+        self.sum_z = np.zeros((n_horizons, n_cells))        # Σ raw z per cell
+        self.sum_var = np.zeros((n_horizons, n_cells))
+        self.sum_var2 = np.zeros((n_horizons, n_cells))
+
+
+class QVarMonitor:
+    """
+    Incremental q-variance for many tickers, fed with daily prices.
+
+    Windows follow compute_panel_windows exactly: missing prices skipped,
+    non-overlapping windows of T daily log returns starting from the first
+    return, windows with non-finite or zero sigma rejected. The loaders de-mean
+    z with the mean over all windows of a (ticker, T), which keeps moving as
+    windows arrive, so completed windows are stored by raw z in cells of width
+    DZ and only shifted by the current mean when a curve is requested. Cells
+    cut by a bin edge are shared out by overlap, so the binned curve agrees
+    with the batch one up to the within-cell spread of the windows.
+    """
+
+    def __init__(self, horizons=HORIZONS, zlim=ZLIM, dz=DZ):
+        self.horizons = np.asarray(horizons, dtype=np.int64)
+        self.zlim = float(zlim)
+        self.dz = float(dz)
+        self.n_cells = int(round(2 * self.zlim / self.dz)) + 2
+        self.tickers = {}
+
+    def _cell(self, z_raw):
+        """Fine cell of each raw z: 0 and n_cells - 1 are the overflow cells"""
+        c = np.floor((z_raw + self.zlim) / self.dz).astype(np.int64) + 1
+        return np.clip(c, 0, self.n_cells - 1)
+
+    def update(self, ticker, price, log_price=False):
+        """Add the next daily price of a ticker"""
+        st = self.tickers.get(ticker)
+        if st is None:
+            st = self.tickers[ticker] = TickerState(len(self.horizons), self.n_cells)
+        if price is None or np.isnan(price):   # missing prices are skipped, as in compute_panel_windows
+            return self
+        with np.errstate(divide='ignore', invalid='ignore'):
+            logp = float(price) if log_price else float(np.log(price))
+        r = logp - st.last_logp
+        st.last_logp = logp
+        if np.isnan(r):      # first price
+            return self
+
+        st.k += 1
+        st.s1 += r
+        st.s2 += r * r
+        done = st.k == self.horizons
+        if done.any():
+            T = self.horizons[done]
+            x = st.s1[done]   # total price change over the period
+            with np.errstate(invalid='ignore'):
+                sigma = np.sqrt(np.clip(st.s2[done] / T - (x / T)**2, 0.0, None)) * SCALE
+            z_raw = x / np.sqrt(T / 252.0)
+
+            # REJECT BAD WINDOWS
+            ok = np.isfinite(sigma) & (sigma > 0) & np.isfinite(z_raw)
+            rows = np.flatnonzero(done)[ok]
+            if len(rows):
+                z_raw, var = z_raw[ok], sigma[ok]**2
+                cells = self._cell(z_raw)
+                st.n_win[rows] += 1
+                st.sum_zraw[rows] += z_raw
+                st.count[rows, cells] += 1
+                st.sum_z[rows, cells] += z_raw
+                st.sum_var[rows, cells] += var
+                st.sum_var2[rows, cells] += var**2
+            st.k[done] = 0
+            st.s1[done] = 0.0
+            st.s2[done] = 0.0
+        return self
+
+    def update_day(self, prices, log_price=False):
+        """Add one day of prices given as {ticker: price} (or a Series indexed by ticker)"""
+        for ticker, price in prices.items():
+            self.update(ticker, price, log_price)
+        return self
+
+    def accumulator(self, bins=BINS, tickers=None, horizons=None):
+        """
+        BinAccumulator of the current de-meaned windows of the selected tickers and horizons.
+
+        A cell that straddles bin edges after de-meaning is shared out over
+        every bin it overlaps (bins may be narrower than a cell), in proportion
+        to the overlap, treating the windows inside a cell as uniform; counts
+        are then fractional.
+        """
+        acc = BinAccumulator(bins)
+        acc.count = acc.count.astype(float)
+        bins = acc.bins
+        rows = np.ones(len(self.horizons), dtype=bool) if horizons is None else np.isin(self.horizons, horizons)
+        lo_edge = -self.zlim + self.dz * (np.arange(self.n_cells) - 1)
+        inner = (np.arange(self.n_cells) > 0) & (np.arange(self.n_cells) < self.n_cells - 1)
+
+        for name in (self.tickers if tickers is None else tickers):
+            st = self.tickers[name]
+            n = st.n_win[rows]
+            mean = np.divide(st.sum_zraw[rows], n, out=np.zeros(len(n)), where=n > 0)
+            count = st.count[rows]
+            h, c = np.nonzero(count)
+            cnt = count[h, c].astype(float)
+            stats = [cnt, st.sum_z[rows][h, c] - cnt * mean[h], st.sum_var[rows][h, c], st.sum_var2[rows][h, c]]
+
+            # share of each cell in every bin: the covered fraction of the cell below each
+            # edge, differenced; overflow cells go whole to the bin of their mean z
+            lo = lo_edge[c] - mean[h]
+            share = np.diff(np.clip((bins - lo[:, None]) / self.dz, 0.0, 1.0), axis=1)
+            outer = np.flatnonzero(~inner[c])
+            b = bin_index(stats[1][outer] / cnt[outer], bins)
+            share[outer] = 0.0
+            share[outer[b >= 0], b[b >= 0]] = 1.0
+            for total, x in zip([acc.count, acc.sum_z, acc.sum_var, acc.sum_var2], stats):
+                total += x @ share
+        return acc
+
+    def binned(self, bins=BINS, tickers=None, horizons=None):
+        """Current binned curve (z_mid, var, count, var_se)"""
+        return self.accumulator(bins, tickers, horizons).binned()
+
+    def r2(self, popt=BASELINE_POPT, bins=BINS, tickers=None, horizons=None):
+        """R² of the current binned curve against the q-variance curve"""
+        return float(r2_score_binned(self.binned(bins, tickers, horizons), popt))
+
+    def fit(self, bins=BINS, tickers=None, horizons=None):
+        """Closed-form (σ₀, zoff) fit of the current binned curve, with standard errors and R²"""
+        from qvar_surface import fit_binned
+
+        binned = self.binned(bins, tickers, horizons)
+        out = fit_binned(binned["z_mid"].to_numpy(), binned["var"].to_numpy())
+        return {k: (v[0].item()) for k, v in out.items()}
+
+    def num_windows(self):
+        """Completed, kept windows over all tickers and horizons"""
+        return int(sum(st.n_win.sum() for st in self.tickers.values()))
+
+    def save(self, path):
+        """
+        Write the state to a compressed .npz, storing only the non-empty cells.
+
+        Ticker keys should be str or int, which load() gives back as they
+        were; any other key comes back as its str().
+        """
+        names = list(self.tickers)
+        states = [self.tickers[t] for t in names]
+        arrays = {
+            "version": np.array(MONITOR_VERSION),
+            "horizons": self.horizons,
+            "grid": np.array([self.zlim, self.dz]),
+            "tickers": np.array([str(t) for t in names], dtype=str),
+            "ticker_is_int": np.array([isinstance(t, (int, np.integer)) for t in names], dtype=bool),
+        }
+        if states:
+            arrays["last_logp"] = np.array([st.last_logp for st in states])
+            for f in ["k", "s1", "s2", "n_win", "sum_zraw"]:
+                arrays[f] = np.stack([getattr(st, f) for st in states])
+            count = np.stack([st.count for st in states])
+            where = np.nonzero(count)
+            arrays["cell_index"] = np.stack(where).astype(np.int32)
+            arrays["count"] = count[where]
+            for f in ["sum_z", "sum_var", "sum_var2"]:
+                arrays[f] = np.stack([getattr(st, f) for st in states])[where]
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Read a state written by save()"""
+        with np.load(path, allow_pickle=False) as npz:
+            if int(npz["version"]) != MONITOR_VERSION:
+                raise ValueError(f"{path} has monitor version {int(npz['version'])}, expected {MONITOR_VERSION}")
+            zlim, dz = npz["grid"]
+            mon = cls(npz["horizons"], zlim, dz)
+            is_int = npz["ticker_is_int"] if "ticker_is_int" in npz.files else np.zeros(len(npz["tickers"]), dtype=bool)
+            names = [int(t) if i else str(t) for t, i in zip(npz["tickers"], is_int)]
+            if not names:
+                return mon
+            dense = {}
+            for f, dtype in [("count", np.int64), ("sum_z", float), ("sum_var", float), ("sum_var2", float)]:
+                a = np.zeros((len(names), len(mon.horizons), mon.n_cells), dtype=dtype)
+                a[tuple(npz["cell_index"])] = npz[f]
+                dense[f] = a
+            for i, name in enumerate(names):
+                st = mon.tickers[name] = TickerState(len(mon.horizons), mon.n_cells)
+                st.last_logp = float(npz["last_logp"][i])
+                for f in ["k", "s1", "s2", "n_win", "sum_zraw"]:
+                    setattr(st, f, npz[f][i].copy())
+                for f, a in dense.items():
+                    setattr(st, f, a[i])
+        return mon
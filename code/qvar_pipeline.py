@@ -0,0 +1,200 @@
+# qvar_pipeline.py - in-process simulate → window → score pipeline
+# Replaces the CSV → data_loader_csv.py → parquet → score_submission.py round trip:
+# prices go straight from the simulator through the window engine into the bin accumulators
+import numpy as np
+import pandas as pd
+from scipy.stats import t as student_t
+
+from window_engine import HORIZONS, compute_windows, save_price_paths
+from qvar_bins import BASELINE_POPT, R2_THRESHOLD, BinAccumulator, jackknife_r2, r2_score_binned
+
+
+def simulate_prices(simulator, params=None):
+    """Call simulator(**params) and return its price array (first element if it returns a tuple)"""
+    out = simulator(**(params or {}))
+    if isinstance(out, tuple):
+        out = out[0]
+    out = np.asarray(out, dtype=float)
+    if out.ndim != 1:
+        raise ValueError(f"Simulator returned prices of shape {out.shape}, expected a single path; "
+                         "window several paths (e.g. antithetic pairs) as separate tickers "
+                         "with compute_panel_windows or windows_from_price_paths")
+    return out
+
+
+def score_windows(windows, popt=BASELINE_POPT, bins=None, sigma="sigma"):
+    """
+    Bin a window table and score it against the q-variance curve.
+
+    sigma names the volatility column, e.g. "sigma_gk" for the Garman–Klass
+    estimate of compute_panel_windows(..., ohlc=...); windows where it is NaN
+    are left out.
+    """
+    acc = BinAccumulator() if bins is None else BinAccumulator(bins)
+    vol = windows[sigma].to_numpy()
+    ok = np.isfinite(vol)
+    acc.update(windows["z"].to_numpy()[ok], vol[ok]**2)
+    binned = acc.binned()
+    if len(binned) == 0:
+        raise ValueError("No valid binned data")
+
+    r2 = r2_score_binned(binned, popt)
+    return {
+        'r2': float(r2),
+        'sigma0': float(popt[0]),
+        'zoff': float(popt[1]),
+        'num_windows': len(windows),
+        'status': "Passed" if r2 >= R2_THRESHOLD else "Failed",
+    }
+
+
+def run_pipeline(simulator, params=None, ticker="Model", horizons=HORIZONS,
+                 popt=BASELINE_POPT, dataset_path=None, prices_path=None, return_windows=False):
+    """
+    Simulate a price path, compute its windows and score it, all in memory.
+
+    Parameters
+    ----------
+    simulator : callable
+        Called as simulator(**params); returns a daily price array, or a tuple
+        whose first element is the price array (like simulate_regime_mixture_qvar).
+    params : dict or None
+        Keyword arguments for the simulator.
+    ticker : str
+        Ticker label for the windows.
+    horizons : array-like of int
+        Window lengths in trading days.
+    popt : sequence
+        (σ₀, zoff) of the reference q-variance curve; defaults to the baseline fit.
+    dataset_path : str, Path or None
+        If given, also write the windows as a dataset.parquet submission artifact.
+    prices_path : str, Path or None
+        If given, also write the compact prices.npz submission artifact.
+    return_windows : bool
+        If True, return (result, windows) instead of result.
+
+    Returns
+    -------
+    result : dict
+        r2, sigma0, zoff, num_windows and status, as in score_new_submission.py.
+    windows : DataFrame, only if return_windows
+    """
+    prices = simulate_prices(simulator, params)
+    windows = compute_windows(prices, ticker=ticker, horizons=horizons)
+    result = score_windows(windows, popt)
+
+    if dataset_path is not None:
+        windows.to_parquet(dataset_path, compression=None)
+    if prices_path is not None:
+        save_price_paths(prices_path, {ticker: prices})
+
+    if return_windows:
+        return result, windows
+    return result
+
+
+def run_adaptive(simulator, params=None, block_days=250_000, target_width=0.002,
+                 threshold=R2_THRESHOLD, confidence=0.95, min_blocks=10, max_days=20_000_000,
+                 seed=None, ticker="Model", horizons=HORIZONS, popt=BASELINE_POPT,
+                 dataset_path=None, return_windows=False, verbose=True):
+    """
+    Simulate in independent blocks until the R² is known precisely enough.
+
+    Each block is a fresh simulator call of block_days days with its own child
+    seed; its windows (de-meaned within the block) go into a per-block bin
+    accumulator. After every block from min_blocks on, a block-jackknife
+    confidence interval for R² is formed, with the Student-t quantile for
+    n_blocks - 1 degrees of freedom, and the run stops when the interval
+    is narrower than target_width, lies entirely above or below threshold,
+    or max_days is reached.
+
+    Parameters
+    ----------
+    simulator : callable
+        Called as simulator(**params, n_days=block_days, seed=block_seed), with an
+        int block_seed spawned from seed.
+    params : dict or None
+        Other keyword arguments for the simulator (without n_days and seed).
+    block_days : int
+        Simulated days per block.
+    target_width : float
+        Stop once the confidence interval of R² is narrower than this.
+    threshold : float
+        Stop once the interval lies clearly above or below this R² (0.995).
+    confidence : float
+        Two-sided confidence level of the interval.
+    min_blocks : int
+        Blocks simulated before stopping is considered (at least 2); fewer
+        than about 10 give a jackknife error too noisy to stop on.
+    max_days : int
+        Hard cap on the number of simulated days.
+    seed : int or None
+        Root seed; block seeds are spawned from it.
+    dataset_path, return_windows :
+        As in run_pipeline. Window dates are offset by block so they stay unique.
+
+    Returns
+    -------
+    result : dict
+        As run_pipeline, plus r2_ci, n_days, n_blocks and stop_reason.
+    windows : DataFrame, only if return_windows
+    """
+    params = dict(params or {})
+    keep_windows = return_windows or dataset_path is not None
+    seeds = np.random.SeedSequence(seed)
+
+    accs, kept = [], []
+    n_days = n_windows = 0
+    stop_reason = "max_days"
+    while n_days + block_days <= max_days:
+        # an int seed, so that simulators calling np.random.seed(seed) work as well
+        block_seed = int(seeds.spawn(1)[0].generate_state(1)[0])
+        prices = simulate_prices(simulator, {**params, 'n_days': block_days, 'seed': block_seed})
+        windows = compute_windows(prices, ticker=ticker, horizons=horizons)
+        accs.append(BinAccumulator().update(windows["z"].to_numpy(), windows["sigma"].to_numpy()**2))
+        if keep_windows:
+            windows["date"] += n_days
+            kept.append(windows)
+        n_days += block_days
+        n_windows += len(windows)
+
+        if len(accs) < max(min_blocks, 2):
+            continue
+        r2, se = jackknife_r2(accs, popt)
+        zcrit = student_t.ppf(0.5 + confidence / 2, len(accs) - 1)
+        lo, hi = r2 - zcrit*se, r2 + zcrit*se
+        if verbose:
+            print(f"  {n_days:,} days: R² = {r2:.5f}  [{lo:.5f}, {hi:.5f}]")
+        if hi - lo < target_width:
+            stop_reason = "precision"
+        elif lo > threshold:
+            stop_reason = "above_threshold"
+        elif hi < threshold:
+            stop_reason = "below_threshold"
+        else:
+            continue
+        break
+
+    if not accs:
+        raise ValueError("max_days is smaller than block_days")
+    r2, se = jackknife_r2(accs, popt)
+    zcrit = student_t.ppf(0.5 + confidence / 2, max(len(accs) - 1, 1))
+    result = {
+        'r2': float(r2),
+        'r2_ci': [float(r2 - zcrit*se), float(r2 + zcrit*se)],
+        'sigma0': float(popt[0]),
+        'zoff': float(popt[1]),
+        'num_windows': n_windows,
+        'n_days': n_days,
+        'n_blocks': len(accs),
+        'stop_reason': stop_reason,
+        'status': "Passed" if r2 >= threshold else "Failed",
+    }
+
+    windows = pd.concat(kept, ignore_index=True) if keep_windows else None
+    if dataset_path is not None:
+        windows.to_parquet(dataset_path, compression=None)
+
+    if return_windows:
+        return result, windows
+    return result
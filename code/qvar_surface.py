@@ -0,0 +1,149 @@
+# qvar_surface.py - q-variance parameters fitted separately for every (ticker, T)
+# With the 1/2 coefficient fixed, σ²(z) = σ₀² + (z - zoff)²/2 is linear in its parameters:
+#     var - z²/2 = (σ₀² + zoff²/2) - zoff·z
+# so the least-squares fit of baseline_fit.py (curve_fit on the binned curve) has a closed
+# form, and all ~10k (ticker, T) fits are solved together from per-bin sums
+#
+# usage: python code/qvar_surface.py [out.csv]   # fit the benchmark, print a summary
+import sys
+
+import numpy as np
+import pandas as pd
+
+from qvar_bins import BINS, bin_index
+
+GROUP_COLUMNS = ["ticker", "T"]
+
+
+def group_codes(df, by=GROUP_COLUMNS):
+    """Group number of every row and the DataFrame of group keys, in sorted key order"""
+    codes, levels = zip(*(pd.factorize(df[c], sort=True) for c in by))
+    key = np.zeros(len(df), dtype=np.int64)
+    for code, level in zip(codes, levels):
+        key = key * len(level) + code
+    groups, ginv = np.unique(key, return_inverse=True)
+
+    keys = {}
+    for c, level in reversed(list(zip(by, levels))):
+        keys[c] = np.asarray(level)[groups % len(level)]
+        groups = groups // len(level)
+    return ginv, pd.DataFrame({c: keys[c] for c in by})
+
+
+def _binned_means(ginv, b, weights, n_groups, nb):
+    """(groups, bins) arrays of mean z and mean var from per-row or per-cell sums"""
+    cell = ginv * nb + b
+    sums = [np.bincount(cell, weights=w, minlength=n_groups * nb).reshape(-1, nb) for w in weights]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sums[1] / sums[0], sums[2] / sums[0]
+
+
+def grouped_bins(df, bins=BINS, by=GROUP_COLUMNS):
+    """
+    Binned curve of every group of a window table.
+
+    Returns the group keys (DataFrame) and arrays z_mid, var of shape
+    (groups, bins) holding the mean z and mean sigma² per bin, NaN where a
+    bin is empty.
+    """
+    ginv, keys = group_codes(df, by)
+    z = df["z"].to_numpy(dtype=float)
+    var = df["sigma"].to_numpy(dtype=float)**2
+    b = bin_index(z, bins)
+    ok = (b >= 0) & np.isfinite(var)
+    z_mid, var_mean = _binned_means(ginv[ok], b[ok], [np.ones(ok.sum()), z[ok], var[ok]],
+                                    len(keys), len(bins) - 1)
+    return keys, z_mid, var_mean
+
+
+def grouped_bins_from_stats(stats, bins=BINS):
+    """grouped_bins for the (ticker, T) groups of a benchmark_stats table"""
+    from benchmark_stats import coarse_map
+
+    ginv, keys = group_codes(stats, GROUP_COLUMNS)
+    b = coarse_map(stats.attrs["edges"], bins)[stats["bin"].to_numpy()]
+    ok = b >= 0
+    z_mid, var_mean = _binned_means(ginv[ok], b[ok], [stats[c].to_numpy(dtype=float)[ok]
+                                                      for c in ["count", "sum_z", "sum_var"]],
+                                    len(keys), len(bins) - 1)
+    return keys, z_mid, var_mean
+
+
+def fit_binned(z_mid, var, min_bins=3):
+    """
+    Closed-form least-squares fit of q-variance to each row of binned curves.
+
+    z_mid, var are (groups, bins) arrays with NaN for empty bins. Each row is
+    fitted unweighted over its non-empty bins, exactly as curve_fit(qvar, z_mid,
+    var) would, and its R² is computed as in r2_score_binned. Standard errors
+    come from the OLS covariance (n - 2 degrees of freedom), mapped to σ₀ by the
+    delta method. Rows with fewer than min_bins bins, or whose fit implies
+    σ₀² < 0, get NaN parameters.
+    """
+    z_mid = np.atleast_2d(z_mid)
+    var = np.atleast_2d(var)
+    m = np.isfinite(z_mid) & np.isfinite(var)
+    z = np.where(m, z_mid, 0.0)
+    v = np.where(m, var, 0.0)
+    y = v - z**2 / 2
+
+    n = m.sum(axis=1).astype(float)
+    Sz, Szz = z.sum(axis=1), (z * z).sum(axis=1)
+    Sy, Szy, Syy = y.sum(axis=1), (z * y).sum(axis=1), (y * y).sum(axis=1)
+    Sv, Svv = v.sum(axis=1), (v * v).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        det = n * Szz - Sz**2
+        slope = (n * Szy - Sz * Sy) / det          # = -zoff
+        a = (Sy - slope * Sz) / n                  # = σ₀² + zoff²/2
+        ss_res = np.clip(Syy - a * Sy - slope * Szy, 0.0, None)
+        ss_tot = Svv - Sv**2 / n
+        r2 = 1 - ss_res / ss_tot
+
+        s2 = ss_res / (n - 2)
+        var_a = s2 * Szz / det
+        var_slope = s2 * n / det
+        cov = -s2 * Sz / det
+        s0_sq = a - slope**2 / 2
+        sigma0 = np.sqrt(np.where(s0_sq >= 0, s0_sq, np.nan))
+        # σ₀ = sqrt(a - slope²/2): gradient (1, -slope) / (2σ₀)
+        sigma0_se = np.sqrt(var_a - 2 * slope * cov + slope**2 * var_slope) / (2 * sigma0)
+        zoff_se = np.sqrt(var_slope)
+
+    bad = (n < min_bins) | ~(det > 0)
+    out = {"n_bins": n.astype(int), "sigma0": sigma0, "zoff": -slope,
+           "sigma0_se": sigma0_se, "zoff_se": zoff_se, "r2": r2}
+    for k in ["sigma0", "zoff", "sigma0_se", "zoff_se", "r2"]:
+        out[k] = np.where(bad, np.nan, out[k])
+    return out
+
+
+def parameter_surface(source, bins=BINS, by=GROUP_COLUMNS, min_bins=3):
+    """
+    Fitted (σ₀, zoff), standard errors and R² per group.
+
+    source is either a window table (columns from by, plus z and sigma) or a
+    benchmark_stats table, in which case the groups are (ticker, T).
+    """
+    if "sum_var" in source.columns:
+        keys, z_mid, var = grouped_bins_from_stats(source, bins)
+    else:
+        keys, z_mid, var = grouped_bins(source, bins, by)
+    fit = fit_binned(z_mid, var, min_bins)
+    return keys.assign(**fit)
+
+
+def main():
+    from benchmark_cache import load_benchmark
+
+    df = load_benchmark(columns=["ticker", "T", "z", "sigma"])
+    surface = parameter_surface(df)
+    print(f"Fitted {surface.sigma0.notna().sum()} of {len(surface)} (ticker, T) groups")
+    print(surface.groupby("T")[["sigma0", "zoff", "r2"]].median().round(4).to_string())
+    if len(sys.argv) > 1:
+        surface.to_csv(sys.argv[1], index=False)
+        print(f"Saved {sys.argv[1]}")
+
+
+if __name__ == "__main__":
+    main()
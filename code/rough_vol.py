@@ -0,0 +1,185 @@
+# rough_vol.py - rough Bergomi (rBergomi) simulation with FFT-based rough noise
+# The volatility driver is the hybrid-scheme Volterra process, its kernel convolution done
+# by FFT in O(n log n) per path and batched across paths, so a grok_rough_vol style run of
+# 13,000 one-year paths takes seconds instead of an O(n²) convolution or a Python loop per
+# path. Stationary fractional Gaussian noise is also available by circulant embedding
+# (Davies-Harte); it has no white-noise innovations to correlate the price with, so the
+# rBergomi simulation does not use it
+import numpy as np
+
+
+def fgn_autocovariance(n, H):
+    """Autocovariance γ(0..n) of unit-step fractional Gaussian noise with Hurst index H"""
+    k = np.arange(n + 1, dtype=float)
+    return 0.5 * (np.abs(k + 1)**(2*H) - 2*np.abs(k)**(2*H) + np.abs(k - 1)**(2*H))
+
+
+def circulant_eigenvalues(n, H):
+    """Eigenvalues of the 2n circulant embedding of the fGn covariance matrix"""
+    gamma = fgn_autocovariance(n, H)
+    row = np.concatenate([gamma, gamma[-2:0:-1]])   # γ0..γn, γn-1..γ1
+    lam = np.fft.fft(row).real
+    if lam.min() < -1e-10 * lam.max():
+        raise ValueError(f"Circulant embedding is not positive definite for H = {H}")
+    return np.clip(lam, 0.0, None)
+
+
+def sample_fgn(n, H, n_paths=1, rng=None, lam=None):
+    """
+    Fractional Gaussian noise by the Davies-Harte method.
+
+    One complex FFT of length 2n gives two independent paths (real and
+    imaginary parts), so n_paths paths cost ceil(n_paths/2) transforms.
+
+    Parameters
+    ----------
+    n : int
+        Number of increments per path.
+    H : float
+        Hurst index, 0 < H < 1.
+    n_paths : int
+        Number of independent paths.
+    rng : numpy Generator or None
+    lam : ndarray or None
+        Precomputed circulant_eigenvalues(n, H), to reuse across batches.
+
+    Returns
+    -------
+    fgn : ndarray, shape (n_paths, n)
+        Unit-step increments with Var = 1 and Cov(k) = γ(k).
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    if lam is None:
+        lam = circulant_eigenvalues(n, H)
+    m = len(lam)   # 2n
+    n_fft = (n_paths + 1) // 2
+
+    w = rng.standard_normal((n_fft, m)) + 1j * rng.standard_normal((n_fft, m))
+    y = np.fft.fft(np.sqrt(lam / m) * w, axis=1)[:, :n]
+    return np.concatenate([y.real, y.imag])[:n_paths]
+
+
+def hybrid_weights(n, H):
+    """
+    Weights of the κ = 1 hybrid scheme for the Volterra kernel (t - s)^(H - 1/2).
+
+    Returns the (2, 2) covariance of a step's Brownian increment ΔW and the
+    exact near-field integral ∫ (t_{i+1} - s)^a dW_s over that step (a = H - 1/2,
+    unit step), and the far-field weights g[k] = b_k^a, k >= 2, applied to the
+    increments k steps back (g[0] = g[1] = 0).
+    """
+    a = H - 0.5
+    cov = np.array([[1.0, 1.0 / (a + 1)],
+                    [1.0 / (a + 1), 1.0 / (2*a + 1)]])
+    k = np.arange(n + 1, dtype=float)
+    g = np.zeros(n + 1)
+    kk = k[2:]
+    b = ((kk**(a + 1) - (kk - 1)**(a + 1)) / (a + 1))**(1.0 / a)   # optimal evaluation points
+    g[2:] = b**a
+    return cov, g
+
+
+def simulate_rough_bergomi(H, eta, rho, xi, n_days=252, n_paths=1,
+                           batch_size=4096, seed=None):
+    """
+    Batched rough Bergomi paths on a daily grid.
+
+    Model (dt = 1/252):
+        Y_t = sqrt(2H) ∫₀ᵗ (t - s)^(H - 1/2) dW_s,   Var(Y_t) = t^(2H)
+        V_t = xi * exp(eta * Y_t - eta²/2 * t^(2H))
+        B   = rho * W + sqrt(1 - rho²) * W⊥
+        ΔL_t = -V_t dt / 2 + sqrt(V_t) ΔB_t
+
+    The Volterra process Y is simulated with the κ = 1 hybrid scheme
+    (Bennedsen, Lunde & Pakkanen), the scheme of ryanmccrickerd/rough_bergomi:
+    the last step is integrated exactly, jointly Gaussian with ΔW, and the
+    rest of the kernel is a convolution of the increments, done by FFT for
+    all paths of a batch at once. The leverage ρ correlates the price noise
+    with the white-noise increments ΔW that drive Y, so B is a Brownian
+    motion and the price is a martingale.
+
+    Parameters
+    ----------
+    H : float
+        Hurst index of the volatility driver, 0 < H < 1/2 (a = H - 1/2 in
+        the ryanmccrickerd/rough_bergomi notation; the grok_rough_vol entry
+        quotes a = -0.43, i.e. H = 0.07).
+    eta : float
+        Vol-of-vol.
+    rho : float
+        Leverage correlation, -1 <= rho <= 1.
+    xi : float
+        Initial (forward) variance, e.g. 0.32².
+    n_days : int
+        Trading days per path (252 for the one-year grok runs).
+    n_paths : int
+        Number of independent paths.
+    batch_size : int
+        Paths simulated per FFT batch, to bound memory.
+    seed : int or None
+
+    Returns
+    -------
+    prices : ndarray, shape (n_paths, n_days+1)
+        Price paths started at 1.
+    V : ndarray, shape (n_paths, n_days)
+        Variance rate at the start of each day.
+    """
+    from scipy.signal import fftconvolve
+
+    if not 0.0 < H < 0.5:
+        raise ValueError(f"The hybrid scheme needs 0 < H < 1/2, got H = {H}")
+    rng = np.random.default_rng(seed)
+    dt = 1.0 / 252.0
+    a = H - 0.5
+    cov, g = hybrid_weights(n_days, H)
+    chol = np.linalg.cholesky(cov)
+    t = dt * np.arange(n_days)   # left end of each step
+
+    prices = np.empty((n_paths, n_days + 1))
+    V = np.empty((n_paths, n_days))
+    for start in range(0, n_paths, batch_size):
+        nb = min(batch_size, n_paths - start)
+
+        # per step: unit-step ΔW and its exact near-field Volterra integral
+        dW = rng.standard_normal((nb, n_days, 2)) @ chol.T
+        # Y at the left end of each step i: near field of step i-1 plus far field of earlier steps
+        far = fftconvolve(dW[:, :, 0], g[None, :], axes=1)[:, :n_days]
+        Y = np.zeros((nb, n_days))
+        Y[:, 1:] = dW[:, :-1, 1] + far[:, 1:]
+        Y *= np.sqrt(2*a + 1) * dt**H
+        Vb = xi * np.exp(eta * Y - 0.5 * eta**2 * t**(2*H))
+
+        dB = (rho * dW[:, :, 0] + np.sqrt(1.0 - rho**2) * rng.standard_normal((nb, n_days))) * np.sqrt(dt)
+        dL = -0.5 * Vb * dt + np.sqrt(Vb) * dB
+
+        L = np.zeros((nb, n_days + 1))
+        np.cumsum(dL, axis=1, out=L[:, 1:])
+        prices[start:start + nb] = np.exp(L)
+        V[start:start + nb] = Vb
+
+    return prices, V
+
+
+def rough_bergomi_prices(H, eta, rho, xi, n_days=252, n_paths=13_000,
+                         batch_size=4096, seed=None):
+    """
+    Single daily price series made by chaining independent rBergomi paths.
+
+    This is how the grok_rough_vol entry built its 13,000-year series (one-year
+    paths concatenated end to end), and the output plugs straight into
+    compute_windows / run_pipeline. Note that windows can straddle the joins.
+
+    The mean daily log return (mostly the -V/2 Itô drift) is removed so that
+    exp() stays in range over thousands of years; window sigmas are unchanged
+    by a constant shift and z is de-meaned per horizon anyway.
+
+    Returns
+    -------
+    prices : ndarray, shape (n_paths*n_days+1,)
+    """
+    paths, _ = simulate_rough_bergomi(H, eta, rho, xi, n_days=n_days, n_paths=n_paths,
+                                      batch_size=batch_size, seed=seed)
+    ret = np.diff(np.log(paths), axis=1).ravel()
+    ret -= ret.mean()
+    return np.exp(np.concatenate([[0.0], np.cumsum(ret)]))
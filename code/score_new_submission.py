@@ -1,4 +1,4 @@
-# score_new_submission.py - scores new submission dataset.parquet files
+# score_new_submission.py - scores new submission dataset.parquet (or prices.npz) files
 # This script is designed for GitHub Actions to score submissions in PRs
 # Fail-safe with error handling - won't crash if submissions are missing files
 import pandas as pd
@@ -9,8 +9,11 @@ from sklearn.metrics import r2_score
 import matplotlib
 matplotlib.use('Agg')  # Non-interactive backend for CI
 import matplotlib.pyplot as plt
+import pyarrow.parquet as pq
+import pyarrow.types as pa_types
 import sys
 import os
+import subprocess
 from pathlib import Path
 import json
 try:
@@ -18,11 +21,60 @@ try:
 except ImportError:
     requests = None
 
+from qvar_bins import BinAccumulator, jackknife_r2
+from window_engine import HORIZONS, load_price_paths, windows_from_price_paths
+from time_invariance import summarize, time_invariance_report
+
+REQUIRED_COLUMNS = ['ticker', 'date', 'T', 'z', 'sigma']
+QUICK_ROW_GROUPS = 8    # at most this many row groups are read for the sampled quick score
+QUICK_BLOCKS = 8        # jackknife blocks of the quick score
+QUICK_MAX_CI = 0.05     # a quick score with a wider 95% half-interval is reported as inconclusive
+
 def qvar(z, s0, zoff):
     """Q-variance function: σ²(z) = σ₀² + (z - z₀)²/2"""
     return (s0**2 + (z - zoff)**2 / 2)
 
-def find_modified_submissions(pr_number=None):
+def submission_folders_in(paths):
+    """Submission folder names touched by a list of repository paths"""
+    changed_folders = set()
+    for file_path in paths:
+        if file_path.startswith('submissions/'):
+            parts = file_path.split('/')
+            if len(parts) >= 3:
+                changed_folders.add(parts[1])
+    return changed_folders
+
+def changed_folders_from_git(base=None, head=None):
+    """Submission folders changed between the PR base and head, from the local git history"""
+    base = base or os.environ.get('BASE_SHA')
+    head = head or os.environ.get('HEAD_SHA') or 'HEAD'
+    if not base and os.environ.get('GITHUB_BASE_REF'):
+        base = f"origin/{os.environ['GITHUB_BASE_REF']}"
+    if not base:
+        raise ValueError("no base commit (set BASE_SHA or GITHUB_BASE_REF)")
+    
+    # three-dot diff: changes on head since it branched from base
+    out = subprocess.run(
+        ['git', 'diff', '--name-only', f'{base}...{head}', '--', 'submissions/'],
+        capture_output=True, text=True, timeout=60
+    )
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip() or f"git diff exited with {out.returncode}")
+    return submission_folders_in(out.stdout.splitlines())
+
+def changed_folders_from_api(pr_number):
+    """Submission folders changed in a PR, from the GitHub REST API"""
+    if requests is None:
+        raise ImportError("requests not available")
+    # Use GitHub API to get PR files (no auth needed for public repos)
+    repo = os.environ.get('GITHUB_REPOSITORY', 'q-variance/challenge')
+    api_url = f"https://api.github.com/repos/{repo}/pulls/{pr_number}/files"
+    response = requests.get(api_url, timeout=10)
+    if response.status_code != 200:
+        raise RuntimeError(f"API returned status {response.status_code}")
+    return submission_folders_in(f.get('filename', '') for f in response.json())
+
+def find_modified_submissions(pr_number=None, use_api=False):
     """Find which submission folders were modified in the PR or check all folders"""
     submissions_dir = Path('submissions')
     if not submissions_dir.exists():
@@ -31,62 +83,223 @@ def find_modified_submissions(pr_number=None):
     # Get all submission folders
     all_folders = [d.name for d in submissions_dir.iterdir() if d.is_dir()]
     
-    # If PR number provided, try to use GitHub API to find changed files
-    if pr_number:
+    # Local git diff between PR base and head; no network needed
+    try:
+        changed_folders = changed_folders_from_git()
+        print(f"✓ git diff: {len(changed_folders)} changed submission folder(s)")
+        return [f for f in all_folders if f in changed_folders]
+    except Exception as e:
+        print(f"Note: Could not diff against the PR base with git: {e}")
+    
+    # Optionally ask the GitHub API instead
+    if pr_number and use_api:
         try:
-            if requests is None:
-                raise ImportError("requests not available")
-            # Use GitHub API to get PR files (no auth needed for public repos)
-            repo = os.environ.get('GITHUB_REPOSITORY', 'q-variance/challenge')
-            api_url = f"https://api.github.com/repos/{repo}/pulls/{pr_number}/files"
-            response = requests.get(api_url, timeout=10)
-            if response.status_code == 200:
-                files = response.json()
-                changed_folders = set()
-                for file_info in files:
-                    file_path = file_info.get('filename', '')
-                    if file_path.startswith('submissions/'):
-                        parts = file_path.split('/')
-                        if len(parts) >= 2:
-                            changed_folders.add(parts[1])
-                if changed_folders:
-                    # Only score folders that were actually changed
-                    return [f for f in all_folders if f in changed_folders]
+            changed_folders = changed_folders_from_api(pr_number)
+            if changed_folders:
+                # Only score folders that were actually changed
+                return [f for f in all_folders if f in changed_folders]
         except Exception as e:
             print(f"Note: Could not fetch PR files from API: {e}")
-            print("   Will check all submission folders instead")
     
-    # Fallback: return all folders (will skip ones without dataset.parquet)
+    print("   Will check all submission folders instead")
+    # Fallback: return all folders (will skip ones without dataset.parquet or prices.npz)
     return all_folders
 
-def score_submission(submission_folder):
+def column_stats(metadata, name):
+    """Min, max and null count of a column from the parquet footer (None if not recorded)"""
+    col_min, col_max, nulls = None, None, 0
+    for i in range(metadata.num_row_groups):
+        rg = metadata.row_group(i)
+        for j in range(rg.num_columns):
+            col = rg.column(j)
+            if col.path_in_schema != name:
+                continue
+            stats = col.statistics
+            if stats is None or not stats.has_min_max:
+                return None
+            col_min = stats.min if col_min is None else min(col_min, stats.min)
+            col_max = stats.max if col_max is None else max(col_max, stats.max)
+            nulls += stats.null_count
+    return {'min': col_min, 'max': col_max, 'nulls': nulls}
+
+def validate_metadata(dataset_path):
+    """Check a submission from its parquet footer only (schema, row count, column statistics)"""
+    try:
+        pf = pq.ParquetFile(dataset_path)
+    except Exception as e:
+        print(f"❌ ERROR: Not a readable parquet file {dataset_path}: {e}")
+        return None
+    
+    metadata = pf.metadata
+    schema = pf.schema_arrow
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in schema.names]
+    if missing_columns:
+        print(f"❌ ERROR: Missing required columns: {missing_columns}")
+        return None
+    
+    errors = []
+    if metadata.num_rows == 0:
+        errors.append("file has no rows")
+    for col in ['T', 'z', 'sigma']:
+        col_type = schema.field(col).type
+        if not (pa_types.is_floating(col_type) or pa_types.is_integer(col_type)):
+            errors.append(f"column {col} has non-numeric type {col_type}")
+    
+    info = {'num_rows': metadata.num_rows, 'num_row_groups': metadata.num_row_groups}
+    if not errors:
+        for col in ['z', 'sigma']:
+            stats = column_stats(metadata, col)
+            info[col] = stats
+            if stats is None:
+                print(f"   Note: no statistics recorded for {col}, range checks skipped")
+                continue
+            if stats['nulls'] == metadata.num_rows:
+                errors.append(f"column {col} is entirely null")
+            elif not (np.isfinite(stats['min']) and np.isfinite(stats['max'])):
+                errors.append(f"column {col} has non-finite values ({stats['min']}, {stats['max']})")
+        if info.get('sigma') and info['sigma']['min'] is not None and info['sigma']['min'] <= 0:
+            errors.append(f"sigma must be positive (min = {info['sigma']['min']})")
+    
+    if errors:
+        for err in errors:
+            print(f"❌ ERROR: {err}")
+        return None
+    
+    print(f"✓ Metadata OK: {info['num_rows']} rows in {info['num_row_groups']} row group(s)")
+    for col in ['z', 'sigma']:
+        if info.get(col):
+            print(f"   {col}: [{info[col]['min']:.4g}, {info[col]['max']:.4g}], nulls: {info[col]['nulls']}")
+    return info
+
+def row_group_ranges(metadata, name):
+    """(min, max) of a numeric column in each row group from the parquet footer, NaN if not recorded"""
+    out = np.full((metadata.num_row_groups, 2), np.nan)
+    for i in range(metadata.num_row_groups):
+        rg = metadata.row_group(i)
+        for j in range(rg.num_columns):
+            col = rg.column(j)
+            if col.path_in_schema == name and col.statistics is not None and col.statistics.has_min_max:
+                out[i] = col.statistics.min, col.statistics.max
+    return out
+
+def quick_score(dataset_path, popt, max_row_groups=QUICK_ROW_GROUPS, n_blocks=QUICK_BLOCKS):
+    """
+    Approximate R² with an error bar from at most max_row_groups row groups.
+    
+    The row groups are spread evenly through the file, a systematic sample:
+    in a window table written ordered by T this takes each horizon in
+    proportion to its rows, to within a row group. Row groups are then
+    horizon strata rather than exchangeable blocks, so each jackknife block
+    is a contiguous slice of every horizon in the sample. The error bar does
+    not cover the row-group granularity (a horizon smaller than a row group
+    can be missed or over-represented), and an interval wider than
+    ±QUICK_MAX_CI is reported as inconclusive rather than as a score.
+    """
+    pf = pq.ParquetFile(dataset_path)
+    n_rg = pf.metadata.num_row_groups
+    picks = np.unique(np.linspace(0, n_rg - 1, min(max_row_groups, n_rg)).round().astype(int))
+    
+    # horizons covered, from the footer's T range of each row group
+    ranges = row_group_ranges(pf.metadata, 'T')
+    if not np.isnan(ranges).any():
+        print(f"   Quick sample covers T in [{ranges[picks, 0].min():g}, {ranges[picks, 1].max():g}] "
+              f"of [{ranges[:, 0].min():g}, {ranges[:, 1].max():g}]")
+    
+    tbl = pf.read_row_groups([int(i) for i in picks], columns=['T', 'z', 'sigma'])
+    T, z, sigma = (tbl.column(c).to_numpy(zero_copy_only=False) for c in ['T', 'z', 'sigma'])
+    finite = np.isfinite(z) & np.isfinite(sigma)
+    if not finite.all():
+        print(f"   Note: {np.sum(~finite)} sampled windows have NaN/inf z or sigma and are left out")
+    
+    # jackknife blocks: contiguous slices of every horizon in the sample
+    block = np.full(len(T), -1)
+    for t in np.unique(T):
+        rows = np.flatnonzero(T == t)
+        block[rows] = np.arange(len(rows)) * n_blocks // len(rows)
+    block[~finite] = -1
+    
+    blocks = [BinAccumulator().update(z[block == b], sigma[block == b]**2) for b in range(n_blocks)]
+    r2, se = jackknife_r2(blocks, popt)
+    rows = int(sum(b.count.sum() for b in blocks))
+    result = {'r2_approx': float(r2), 'r2_approx_se': float(se), 'row_groups_sampled': int(len(picks))}
+    if not np.isfinite(se) or 1.96*se > QUICK_MAX_CI:
+        print(f"⚠️  Quick score on {len(picks)}/{n_rg} row groups ({rows} binned windows) is inconclusive: "
+              f"95% interval ±{1.96*se:.3g} is wider than ±{QUICK_MAX_CI}")
+        result['r2_approx'] = None
+        return result
+    print(f"✓ Quick score on {len(picks)}/{n_rg} row groups ({rows} binned windows): "
+          f"R² ≈ {r2:.4f} ± {1.96*se:.4f}")
+    return result
+
+def windows_from_prices_file(prices_path):
+    """Load a prices.npz artifact and compute its windows with the project's window engine"""
+    try:
+        paths = load_price_paths(prices_path)
+    except Exception as e:
+        print(f"❌ ERROR: Failed to read {prices_path}: {e}")
+        return None
+    
+    errors = []
+    if not paths:
+        errors.append("no price series in file")
+    for ticker, L in paths.items():
+        if L.ndim != 1 or not np.issubdtype(L.dtype, np.floating):
+            errors.append(f"{ticker}: expected a 1-D float array, got {L.dtype} with shape {L.shape}")
+        elif len(L) <= max(HORIZONS):
+            errors.append(f"{ticker}: only {len(L)} prices, shorter than the longest window")
+    if errors:
+        for err in errors:
+            print(f"❌ ERROR: {err}")
+        return None
+    
+    print(f"✓ Loaded {len(paths)} price series ({sum(len(L) for L in paths.values())} days) from {prices_path}")
+    df = windows_from_price_paths(paths)
+    print(f"✓ Computed {len(df)} windows")
+    return df
+
+def score_submission(submission_folder, quick=False):
     """Score a single submission - fail-safe with error handling"""
     submission_path = Path('submissions') / submission_folder
     dataset_path = submission_path / 'dataset.parquet'
+    prices_path = submission_path / 'prices.npz'
     
     print(f"\n{'='*60}")
     print(f"Scoring submission: {submission_folder}")
     print(f"{'='*60}")
     
-    # Check if dataset.parquet exists
-    if not dataset_path.exists():
-        print(f"⚠️  WARNING: dataset.parquet not found in {submission_path}")
-        print(f"   Skipping {submission_folder}")
-        return None
-    
-    # Read the submission dataset
-    try:
-        df = pd.read_parquet(dataset_path)
-        print(f"✓ Loaded {len(df)} windows from {dataset_path}")
-    except Exception as e:
-        print(f"❌ ERROR: Failed to read {dataset_path}: {e}")
-        return None
+    popt = [0.2586, 0.0214]  # Baseline fit parameters
+    quick_result = None
     
-    # Validate required columns
-    required_columns = ['ticker', 'date', 'T', 'z', 'sigma']
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    if missing_columns:
-        print(f"❌ ERROR: Missing required columns: {missing_columns}")
+    if dataset_path.exists():
+        # Validate from the parquet footer before loading any data
+        if validate_metadata(dataset_path) is None:
+            return None
+        
+        if quick:
+            try:
+                quick_result = quick_score(dataset_path, popt)
+            except Exception as e:
+                print(f"⚠️  WARNING: Quick score failed: {e}")
+        
+        # Read the submission dataset
+        try:
+            df = pd.read_parquet(dataset_path, columns=REQUIRED_COLUMNS)
+            print(f"✓ Loaded {len(df)} windows from {dataset_path}")
+        except Exception as e:
+            print(f"❌ ERROR: Failed to read {dataset_path}: {e}")
+            return None
+    elif prices_path.exists():
+        # Compact price-path submission: windows are computed here
+        try:
+            df = windows_from_prices_file(prices_path)
+        except Exception as e:
+            print(f"❌ ERROR: Failed to compute windows from {prices_path}: {e}")
+            return None
+        if df is None:
+            return None
+    else:
+        print(f"⚠️  WARNING: neither dataset.parquet nor prices.npz found in {submission_path}")
+        print(f"   Skipping {submission_folder}")
         return None
     
     try:
@@ -111,13 +324,21 @@ def score_submission(submission_folder):
             return None
         
         # Fit to q-variance curve (using fixed baseline parameters)
-        popt = [0.2586, 0.0214]  # Baseline fit parameters
-        
         fitted = qvar(binned.z_mid, popt[0], popt[1])
         r2 = 1 - np.sum((binned["var"] - fitted)**2) / np.sum((binned["var"] - binned["var"].mean())**2)
         
         print(f"✓ Q-Variance fit: σ₀ = {popt[0]:.4f}, zoff = {popt[1]:.4f}, R² = {r2:.6f}")
         
+        # Time invariance: KS / Anderson–Darling tests of z between all pairs of horizons
+        time_invariance = None
+        try:
+            time_invariance = summarize(time_invariance_report(data["z"], data["T"]))
+            if time_invariance['num_pairs']:
+                print(f"✓ Time invariance: mean KS = {time_invariance['ks_mean']:.4f}, "
+                      f"{time_invariance['ks_reject_frac']:.0%} of {time_invariance['num_pairs']} horizon pairs rejected")
+        except Exception as e:
+            print(f"⚠️  WARNING: Time-invariance tests failed: {e}")
+        
         # Try to extract number of parameters from README
         readme_path = submission_path / 'README.md'
         num_params = None
@@ -142,8 +363,11 @@ def score_submission(submission_folder):
             'zoff': float(popt[1]),
             'num_windows': len(data),
             'num_params': num_params,
-            'status': status
+            'status': status,
+            'time_invariance': time_invariance
         }
+        if quick_result:
+            result.update(quick_result)
         
         # Output result in JSON format for leaderboard script
         print(f"\n{'='*60}")
@@ -161,16 +385,20 @@ def score_submission(submission_folder):
 def main():
     """Main function - fail-safe"""
     try:
-        # Check if we have a PR number
-        if len(sys.argv) > 1:
-            pr_number = sys.argv[1]
+        # Check if we have a PR number; --quick adds a sampled quick score before the full one,
+        # --use-api lets the GitHub API stand in when the local git diff is unavailable
+        args = [a for a in sys.argv[1:] if not a.startswith('--')]
+        quick = '--quick' in sys.argv[1:]
+        use_api = '--use-api' in sys.argv[1:]
+        if args:
+            pr_number = args[0]
             print(f"Processing PR #{pr_number}")
         else:
             pr_number = None
             print("No PR number provided, checking all submission folders...")
         
         # Find modified submissions
-        submission_folders = find_modified_submissions(pr_number)
+        submission_folders = find_modified_submissions(pr_number, use_api=use_api)
         
         if not submission_folders:
             print("⚠️  No submission folders found")
@@ -181,13 +409,13 @@ def main():
         # Score each submission
         results = []
         for folder in submission_folders:
-            result = score_submission(folder)
+            result = score_submission(folder, quick=quick)
             if result:
                 results.append(result)
         
         if not results:
             print("⚠️  No valid submissions scored")
-            print("   (This is OK if submissions don't have dataset.parquet)")
+            print("   (This is OK if submissions don't have dataset.parquet or prices.npz)")
             # Don't fail - just exit gracefully
             sys.exit(0)
         
@@ -0,0 +1,294 @@
+# score_server.py - warm local scoring service for interactive model development
+# Keeps the interpreter, the scientific imports, the benchmark aggregates and the bin
+# configuration resident, so each score costs only the read and binning of the submission.
+# Listens on localhost only; recent results are kept in a small LRU cache keyed by the
+# file's path, size and mtime, or by a hash of an in-memory Arrow buffer
+#
+# usage: python code/score_server.py [--port N]                        # start the service
+#        python code/score_server.py score dataset.parquet [--time-invariance] [--port N]
+#   or POST {"path": ...} as JSON, or an Arrow IPC stream, to http://127.0.0.1:N/score
+import hashlib
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from benchmark_stats import STATS_FILE, build_stats, read_stats, rebin, write_stats
+from qvar_bins import BASELINE_POPT, BINS, R2_THRESHOLD, BinAccumulator, r2_score_binned
+from time_invariance import summarize, time_invariance_report
+from window_engine import load_price_paths, windows_from_price_paths
+
+HOST = "127.0.0.1"
+PORT = 8765
+CACHE_SIZE = 16
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+SCORE_COLUMNS = ["T", "z", "sigma"]
+
+
+def read_columns(table):
+    """(T, z, sigma) arrays of an Arrow table, checking that the columns are there"""
+    missing = [c for c in SCORE_COLUMNS if c not in table.column_names]
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}")
+    return tuple(table.column(c).to_numpy() for c in SCORE_COLUMNS)
+
+
+def read_source(path):
+    """(T, z, sigma) of a dataset.parquet, prices.npz or Arrow IPC (.arrow / .feather) file"""
+    path = Path(path)
+    if path.suffix == ".npz":
+        df = windows_from_price_paths(load_price_paths(path))
+        return tuple(df[c].to_numpy() for c in SCORE_COLUMNS)
+    if path.suffix in (".arrow", ".feather"):
+        return read_columns(ipc.open_file(pa.memory_map(str(path), "r")).read_all())
+    return read_columns(pq.read_table(path, columns=SCORE_COLUMNS))
+
+
+def read_buffer(data):
+    """(T, z, sigma) of an in-memory Arrow IPC stream (or file) buffer"""
+    try:
+        table = ipc.open_stream(pa.py_buffer(data)).read_all()
+    except pa.ArrowInvalid:
+        table = ipc.open_file(pa.py_buffer(data)).read_all()
+    return read_columns(table)
+
+
+class ScoreService:
+    """
+    Scorer with the benchmark held in memory.
+
+    Results have the keys of score_new_submission.py (r2, sigma0, zoff,
+    num_windows, status, time_invariance) plus r2_vs_benchmark, the R² of
+    the submission's binned variance against the benchmark's in the same
+    bins. The time-invariance tests take seconds on millions of windows, so
+    they only run when asked for.
+    """
+
+    def __init__(self, stats_path=STATS_FILE, popt=BASELINE_POPT, bins=BINS, cache_size=CACHE_SIZE):
+        self.popt = list(popt)
+        self.bins = np.asarray(bins, dtype=float)
+        if Path(stats_path).exists():
+            stats = read_stats(stats_path)
+        else:
+            from benchmark_cache import load_benchmark
+            stats = build_stats(load_benchmark(columns=["ticker", "T", "z", "sigma"]))
+            write_stats(stats, stats_path)
+        coarse = rebin(stats, self.bins)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.benchmark_var = coarse["sum_var"] / coarse["count"]   # NaN for empty bins
+        self.benchmark_windows = int(stats.attrs["source_rows"])
+        self.benchmark_r2 = float(r2_score_binned(self._accumulator(coarse).binned(), self.popt))
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        # run the binning and test code once, so the first request is as fast as the rest
+        rng = np.random.default_rng(0)
+        self.score_arrays(np.repeat([5, 10, 20], 100), rng.normal(0, 0.2, 300), np.full(300, 0.2), True)
+
+    def _accumulator(self, sums):
+        acc = BinAccumulator(self.bins)
+        acc.count, acc.sum_z, acc.sum_var, acc.sum_var2 = (sums[k] for k in ["count", "sum_z", "sum_var", "sum_var2"])
+        return acc
+
+    def info(self):
+        """Benchmark summary and cache state"""
+        return {
+            "benchmark_r2": self.benchmark_r2,
+            "benchmark_windows": self.benchmark_windows,
+            "bins": self.bins.tolist(),
+            "popt": self.popt,
+            "cached": len(self._cache),
+        }
+
+    def score_arrays(self, T, z, sigma, time_invariance=False):
+        """Score dict of a submission given as arrays; windows with a NaN sigma are left out"""
+        sigma = np.asarray(sigma, dtype=float)
+        ok = np.isfinite(sigma)
+        T, z, sigma = np.asarray(T)[ok], np.asarray(z, dtype=float)[ok], sigma[ok]
+        acc = BinAccumulator(self.bins).update(z, sigma**2)
+        binned = acc.binned()
+        if len(binned) == 0:
+            raise ValueError("No valid binned data")
+        r2 = float(r2_score_binned(binned, self.popt))
+
+        # against the benchmark curve, over the bins both have windows in
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mine = acc.sum_var / acc.count
+        ok = np.isfinite(mine) & np.isfinite(self.benchmark_var)
+        ref = self.benchmark_var[ok]
+        r2_vs_benchmark = float(1 - np.sum((mine[ok] - ref)**2) / np.sum((ref - ref.mean())**2))
+
+        return {
+            "r2": r2,
+            "sigma0": float(self.popt[0]),
+            "zoff": float(self.popt[1]),
+            "num_windows": int(len(z)),
+            "status": "Passed" if r2 >= R2_THRESHOLD else "Failed",
+            "r2_vs_benchmark": r2_vs_benchmark,
+            "time_invariance": summarize(time_invariance_report(z, T)) if time_invariance else None,
+        }
+
+    def score(self, key, load, time_invariance=False, unchanged=None):
+        """
+        Cached score: load() gives (T, z, sigma) and only runs on a miss.
+
+        If unchanged() is given and returns False after the load, the source
+        changed while it was read and the result is returned without caching.
+        """
+        key = (key, bool(time_invariance))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return dict(self._cache[key], cached=True)
+        result = self.score_arrays(*load(), time_invariance=time_invariance)
+        if unchanged is not None and not unchanged():
+            return dict(result, cached=False)
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)   # least recently used
+        return dict(result, cached=False)
+
+    def score_path(self, path, time_invariance=False):
+        """Score a file; a rewritten file (new size or mtime) is a cache miss"""
+        path = Path(path).resolve()
+
+        def stamp():
+            st = path.stat()
+            return str(path), st.st_size, st.st_mtime_ns
+
+        key = stamp()
+        # stat again after reading, so a write in between is not cached under the old stamp
+        return self.score(key, lambda: read_source(path), time_invariance, lambda: stamp() == key)
+
+    def score_buffer(self, data, time_invariance=False):
+        """Score an Arrow IPC buffer, cached by its content hash"""
+        return self.score(hashlib.sha256(data).hexdigest(), lambda: read_buffer(data), time_invariance)
+
+
+def as_flag(value):
+    """Boolean request option, accepting true/false, 1/0 and their string forms"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ("1", "true", "0", "false", ""):
+        return value.strip().lower() in ("1", "true")
+    raise ValueError(f"Expected true or false, got {value!r}")
+
+
+class ScoreHandler(BaseHTTPRequestHandler):
+    """GET /info; POST /score with a JSON {"path": ...} or an Arrow IPC stream body"""
+
+    service = None
+
+    def _reply(self, code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/info":
+            self._reply(200, self.service.info())
+        else:
+            self._reply(404, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/score":
+            self._reply(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        t0 = time.perf_counter()
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            if self.headers.get("Content-Type", "").startswith(ARROW_STREAM):
+                ti = as_flag(parse_qs(url.query).get("time_invariance", ["0"])[0])
+                result = self.service.score_buffer(data, ti)
+            else:
+                request = json.loads(data or b"{}")
+                if not isinstance(request, dict) or "path" not in request:
+                    raise ValueError("Request needs a JSON object with a path, or an Arrow IPC stream body")
+                if not isinstance(request["path"], str):
+                    raise ValueError(f"path must be a string, got {request['path']!r}")
+                result = self.service.score_path(request["path"], as_flag(request.get("time_invariance", False)))
+        except (OSError, ValueError, pa.ArrowException) as e:
+            self._reply(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        result["elapsed_ms"] = round(1000 * (time.perf_counter() - t0), 2)
+        self._reply(200, result)
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
+
+def serve(port=PORT, service=None):
+    """Run the service on localhost until interrupted"""
+    ScoreHandler.service = service or ScoreService()
+    server = ThreadingHTTPServer((HOST, port), ScoreHandler)
+    print(f"Scoring on http://{HOST}:{port} (benchmark R² = {ScoreHandler.service.benchmark_r2:.4f})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def score_remote(source, port=PORT, time_invariance=False, timeout=600):
+    """
+    Score through a running service.
+
+    source is a file path, or a pyarrow Table / pandas DataFrame with columns
+    T, z and sigma, which is sent as an Arrow IPC stream without touching disk.
+    """
+    url = f"http://{HOST}:{port}/score"
+    if isinstance(source, (str, Path)):
+        body = json.dumps({"path": str(Path(source).resolve()), "time_invariance": time_invariance}).encode()
+        headers = {"Content-Type": "application/json"}
+    else:
+        table = source if isinstance(source, pa.Table) else pa.Table.from_pandas(source[SCORE_COLUMNS],
+                                                                                 preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        body = sink.getvalue().to_pybytes()
+        headers = {"Content-Type": ARROW_STREAM}
+        url += "?time_invariance=1" if time_invariance else ""
+    request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise ValueError(json.loads(e.read()).get("error", str(e))) from None
+
+
+def main():
+    args = sys.argv[1:]
+    port = int(args[args.index("--port") + 1]) if "--port" in args else PORT
+    if args and args[0] == "score":
+        result = score_remote(args[1], port, time_invariance="--time-invariance" in args)
+        print(json.dumps(result, indent=2))
+    else:
+        serve(port)
+
+
+if __name__ == "__main__":
+    main()
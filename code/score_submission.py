@@ -7,13 +7,16 @@ from scipy.stats import norm, poisson
 from sklearn.metrics import r2_score
 import matplotlib.pyplot as plt
 
-# load the parquet files from data_loader.py
-df = pd.concat([pd.read_parquet("dataset_part1.parquet"),pd.read_parquet("dataset_part2.parquet"),pd.read_parquet("dataset_part3.parquet")])
+from benchmark_cache import load_benchmark
+from time_invariance import summarize, time_invariance_report
+
+# load the parquet files from data_loader.py, via a memory-mapped Arrow cache built on first run
+df = load_benchmark(columns=["T", "z", "sigma"])
+#df = pd.concat([pd.read_parquet("dataset_part1.parquet"),pd.read_parquet("dataset_part2.parquet"),pd.read_parquet("dataset_part3.parquet")])
 
 #df = pd.read_parquet("dataset.parquet")  # READ SUBMISSION DATA
 
-data = df.copy()
-data["var"] = data.sigma**2
+data = df.assign(var=df.sigma**2)   # no deep copy: z and sigma stay backed by the mapped cache
 
 print(f"{len(data)} windows")
 print(f"z has NaNs: {data['z'].isna().sum()}")  # → 0
@@ -126,6 +129,11 @@ plt.legend(fontsize=10, loc='upper right')
 plt.grid(alpha=0.3)
 plt.tight_layout()
 
+# all 26×25/2 horizon pairs, not just TVEC: two-sample KS and Anderson–Darling tests of z
+report = time_invariance_report(data["z"], data["T"])
+for k, v in summarize(report).items():
+    print(f"{k} = {v}")
+
 # Save for announcement / paper
 #plt.savefig("q_variance_density_with_R2.png", dpi=300, bbox_inches='tight')
 #plt.savefig("q_variance_density_with_R2.pdf", bbox_inches='tight')
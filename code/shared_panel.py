@@ -0,0 +1,136 @@
+# shared_panel.py - publishes large arrays once for a pool of worker processes
+# The arrays are packed into a single memory-mapped file (in /dev/shm when available, so
+# RAM-backed) and workers attach to it through a small picklable handle. Every worker
+# maps the same physical pages read-only, so fanning out over the benchmark or a long
+# simulation costs no copies and no pickling of the data itself
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ALIGN = 64
+SHM_DIR = "/dev/shm"
+
+
+def default_dir():
+    """RAM-backed /dev/shm if present, otherwise the temp directory"""
+    return SHM_DIR if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK) else tempfile.gettempdir()
+
+
+class SharedArrays:
+    """
+    Named NumPy arrays published in one memory-mapped file.
+
+    The publishing process owns the file and removes it on close() (or at the
+    end of a with block); handle is a small dict that attach() turns back into
+    read-only arrays in any process on the same machine.
+    """
+
+    def __init__(self, arrays, directory=None, meta=None):
+        fields, offset = [], 0
+        arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+        for name, a in arrays.items():
+            if a.dtype.hasobject:
+                raise ValueError(f"Array {name} has dtype object and cannot be shared")
+            fields.append([name, a.dtype.str, list(a.shape), offset])
+            offset += -(-a.nbytes // ALIGN) * ALIGN
+        self.path = Path(directory or default_dir()) / f"qvar-{uuid.uuid4().hex}.bin"
+        self.handle = {"path": str(self.path), "fields": fields, "nbytes": offset, "meta": meta or {}}
+
+        with open(self.path, "wb") as f:
+            f.truncate(max(offset, 1))
+        if offset:
+            buf = np.memmap(self.path, dtype=np.uint8, mode="r+", shape=(offset,))
+            for (name, _, _, start), a in zip(fields, arrays.values()):
+                buf[start:start + a.nbytes] = a.reshape(-1).view(np.uint8)
+            buf.flush()
+            del buf
+
+    def close(self):
+        """Remove the file; views already attached stay valid until they are released"""
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(handle):
+    """{name: read-only array} of a published handle, mapped without copying"""
+    if not handle["nbytes"]:
+        return {name: np.empty(shape, dtype=dtype) for name, dtype, shape, _ in handle["fields"]}
+    buf = np.memmap(handle["path"], dtype=np.uint8, mode="r", shape=(handle["nbytes"],))
+    out = {}
+    for name, dtype, shape, start in handle["fields"]:
+        dtype = np.dtype(dtype)
+        n = int(np.prod(shape)) * dtype.itemsize
+        out[name] = buf[start:start + n].view(dtype).reshape(shape)
+    return out
+
+
+# Window tables: numeric columns are shared as they are; ticker (and any other object
+# column) is shared as integer codes, with its distinct values carried in the handle
+
+def publish_frame(df, directory=None):
+    """SharedArrays of a DataFrame such as a window table"""
+    arrays, labels = {}, {}
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object or isinstance(values.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+            codes, uniques = pd.factorize(values, sort=False)
+            arrays[col] = codes.astype(np.int32)
+            labels[col] = [str(u) for u in uniques]
+        else:
+            arrays[col] = values.to_numpy()
+    return SharedArrays(arrays, directory, meta={"columns": list(map(str, df.columns)), "labels": labels})
+
+
+def attach_frame(handle, columns=None):
+    """
+    DataFrame of a publish_frame handle.
+
+    Numeric columns wrap the mapping without copying; coded columns come
+    back as Categoricals, which also avoids materializing one string per row.
+    """
+    arrays = attach(handle)
+    labels = handle["meta"]["labels"]
+    data = {}
+    for col in (columns or handle["meta"]["columns"]):
+        if col in labels:
+            data[col] = pd.Categorical.from_codes(arrays[col], labels[col])
+        else:
+            data[col] = arrays[col]
+    return pd.DataFrame(data, copy=False)
+
+
+# Process pools: each worker attaches once, in its initializer, and every task then
+# receives the mapped arrays; only the handle and the task arguments are pickled
+
+_worker_arrays = None
+
+
+def _init_worker(handle):
+    global _worker_arrays
+    _worker_arrays = attach(handle)
+
+
+def _run_task(func, task):
+    return func(_worker_arrays, task)
+
+
+def pool_map(func, handle, tasks, workers=None):
+    """
+    [func(arrays, task) for task in tasks], run in a process pool.
+
+    func must be a module-level function so that it can be sent to the
+    workers; arrays is the attach()ed view of handle in each worker.
+    """
+    tasks = list(tasks)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(handle,)) as pool:
+        return list(pool.map(_run_task, [func] * len(tasks), tasks))
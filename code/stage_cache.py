@@ -0,0 +1,154 @@
+# stage_cache.py - content-addressed cache for the stages of a submission pipeline
+# Each stage result is stored under a hash of the stage name, its parameters and the
+# content digests of its inputs, so a stage only reruns when something it depends on
+# changed. Results carry their own content digest, which keys the stages downstream.
+# The cache directory is kept under a size cap by evicting the least recently used entries
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = ".stage_cache"
+MAX_BYTES = 2 * 1024**3
+
+
+def digest_of(value):
+    """Content digest of an array, DataFrame, dict of bytes or JSON-serializable value"""
+    h = hashlib.sha256()
+    if isinstance(value, np.ndarray):
+        h.update(str((value.dtype.str, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).view(np.uint8))
+    elif isinstance(value, pd.DataFrame):
+        h.update(json.dumps([list(map(str, value.columns)), list(map(str, value.dtypes))]).encode())
+        h.update(pd.util.hash_pandas_object(value, index=False).to_numpy().view(np.uint8))
+    elif isinstance(value, dict) and all(isinstance(v, bytes) for v in value.values()):
+        for name in sorted(value):
+            h.update(name.encode() + b"\0" + hashlib.sha256(value[name]).digest())
+    else:
+        h.update(json.dumps(value, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def source_digest(func):
+    """Digest of a function's or module's source, so that editing it invalidates its stage"""
+    return hashlib.sha256(inspect.getsource(func).encode()).hexdigest()[:16]
+
+
+class StageCache:
+    """
+    Directory of stage results keyed by what they were computed from.
+
+    Supported result kinds: "array" (.npy), "frame" (.parquet), "json" and
+    "files" (a dict of file name to bytes, e.g. rendered figures).
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES, enabled=True):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+    @staticmethod
+    def key(stage, params=None, inputs=()):
+        """Cache key of a stage from its parameters and the digests of its inputs"""
+        blob = json.dumps({"stage": stage, "params": params, "inputs": list(inputs)},
+                          sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _path(self, key):
+        return self.root / key[:2] / key
+
+    def get(self, key):
+        """(value, digest) of a cached entry, or None"""
+        path = self._path(key)
+        meta_path = path / "meta.json"
+        if not self.enabled or not meta_path.exists():
+            return None
+        try:
+            meta = json.loads(meta_path.read_text())
+            kind = meta["kind"]
+            if kind == "array":
+                value = np.load(path / "value.npy", allow_pickle=False)
+            elif kind == "frame":
+                value = pd.read_parquet(path / "value.parquet")
+            elif kind == "json":
+                value = json.loads((path / "value.json").read_text())
+            else:
+                value = {name: (path / "files" / name).read_bytes() for name in meta["files"]}
+        except Exception as e:
+            print(f"⚠️  WARNING: Ignoring unreadable cache entry {key[:12]}: {e}")
+            return None
+        now = time.time()
+        os.utime(meta_path, (now, now))   # last use, for LRU eviction
+        return value, meta["digest"]
+
+    def put(self, key, value, kind):
+        """Store a value and return its content digest"""
+        digest = digest_of(value)
+        if not self.enabled:
+            return digest
+        path = self._path(key)
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        meta = {"kind": kind, "digest": digest}
+        if kind == "array":
+            np.save(tmp / "value.npy", value, allow_pickle=False)
+        elif kind == "frame":
+            value.to_parquet(tmp / "value.parquet", index=False)
+        elif kind == "json":
+            (tmp / "value.json").write_text(json.dumps(value, default=str))
+        elif kind == "files":
+            (tmp / "files").mkdir()
+            for name, data in value.items():
+                (tmp / "files" / name).write_bytes(data)
+            meta["files"] = sorted(value)
+        else:
+            raise ValueError(f"Unknown cache kind {kind}")
+        (tmp / "meta.json").write_text(json.dumps(meta))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)   # readers never see a partial entry
+        self.evict()
+        return digest
+
+    def run(self, stage, params, inputs, compute, kind):
+        """
+        Cached result of a stage: (value, digest).
+
+        params are the stage's own settings and inputs the digests of the stage
+        results it consumes; compute() is only called on a miss.
+        """
+        key = self.key(stage, params, inputs)
+        hit = self.get(key)
+        if hit is not None:
+            print(f"  [cache] {stage}: reusing {key[:12]}")
+            return hit
+        value = compute()
+        return value, self.put(key, value, kind)
+
+    def entries(self):
+        """(last use, bytes, path) of every entry, oldest first"""
+        out = []
+        if not self.root.exists():
+            return out
+        for meta_path in self.root.glob("*/*/meta.json"):
+            entry = meta_path.parent
+            size = sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+            out.append((meta_path.stat().st_mtime, size, entry))
+        return sorted(out)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+        return total
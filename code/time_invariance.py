@@ -0,0 +1,176 @@
+# time_invariance.py - two-sample tests of the z distribution between all pairs of horizons
+# Q-variance requires the distribution of z to be the same for every T. The z values of each
+# horizon are sorted once; every pair is then merged with searchsorted instead of re-sorting,
+# so the 26×25/2 KS and Anderson–Darling tests on 3M windows take seconds
+#
+# usage: python code/time_invariance.py [dataset.parquet] [--workers N]   # default: the benchmark
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy.stats import kstwo
+
+ALPHA = 0.05
+# 5% critical value of the standardized two-sample Anderson–Darling statistic
+# (Scholz & Stephens 1987, k = 2), as used by scipy.stats.anderson_ksamp
+AD_CRITICAL_5PCT = 1.961
+
+
+def sorted_samples(z, T, horizons=None):
+    """{T: sorted z of the windows of horizon T}, NaNs dropped"""
+    z = np.asarray(z, dtype=float)
+    T = np.asarray(T)
+    ok = np.isfinite(z)
+    z, T = z[ok], T[ok]
+    order = np.lexsort((z, T))   # one sort for all horizons
+    z, T = z[order], T[order]
+    keys, starts = np.unique(T, return_index=True)
+    ends = np.r_[starts[1:], len(T)]
+    samples = {int(k): z[s:e] for k, s, e in zip(keys, starts, ends)}
+    if horizons is not None:
+        samples = {int(k): samples[int(k)] for k in horizons if int(k) in samples}
+    return samples
+
+
+def merge_sorted(a, b):
+    """Merged sample of sorted a, b and a 0/1 flag of which entries came from a"""
+    N = len(a) + len(b)
+    pos_a = np.arange(len(a)) + np.searchsorted(b, a, side='left')
+    from_a = np.zeros(N, dtype=bool)
+    from_a[pos_a] = True
+    merged = np.empty(N)
+    merged[from_a] = a
+    merged[~from_a] = b
+    return merged, from_a
+
+
+def harmonic_sums(N):
+    """h_i = Σ_{l≤i} 1/l for i = 1..N-1, shared by all pairs up to N windows"""
+    return np.cumsum(1 / np.arange(1, N, dtype=float))
+
+
+def two_sample_tests(a, b, hcum=None):
+    """
+    Two-sample KS and Anderson–Darling tests for sorted a, b from one merge.
+
+    Returns the KS distance D, its asymptotic p-value (as ks_2samp with
+    method='asymp'), and the standardized Anderson–Darling statistic: the
+    midrank form A²_akN of Scholz & Stephens (1987), which is valid with
+    ties, as scipy's anderson_ksamp computes by default, centred on its mean
+    k - 1 and divided by its exact finite-N standard deviation. Compare the
+    latter with AD_CRITICAL_5PCT.
+    """
+    n, m = len(a), len(b)
+    N = n + m
+    merged, from_a = merge_sorted(a, b)
+    M = np.cumsum(from_a)[:-1].astype(float)   # elements of a among the first j
+    j = np.arange(1, N, dtype=float)
+
+    # the empirical CDFs only step at the last of a run of tied values
+    step = merged[1:] != merged[:-1]
+    D = float(np.max(np.abs(M[step] / n - (j[step] - M[step]) / m), initial=0.0))
+    p = float(kstwo.sf(D, np.round(n * m / (n + m))))
+
+    # midrank form: one term per distinct value z*_j with multiplicity l_j, counting
+    # half of the ties as below it (B_aj = B_j - l_j/2, M_aj = M_j - f_j/2)
+    last = np.r_[np.flatnonzero(step), N - 1]        # last index of each run of ties
+    B = last + 1.0
+    Ma = np.cumsum(from_a)[last].astype(float)
+    l = np.diff(np.r_[0.0, B])
+    f = np.diff(np.r_[0.0, Ma])
+    Ba, Ma = B - l / 2, Ma - f / 2
+    A2 = (N - 1) / N**2 * (1 / n + 1 / m) * np.sum(l * (N * Ma - n * Ba)**2 / (Ba * (N - Ba) - N * l / 4))
+    k = 2
+    H = 1 / n + 1 / m
+    hcum = harmonic_sums(N) if hcum is None else hcum[:N - 1]
+    h = hcum[-1]
+    i = np.arange(1, N - 1)
+    g = np.sum((h - hcum[i - 1]) / (N - i))   # Σ_{i<j≤N-1} 1/((N-i) j)
+    a_ = (4*g - 6)*(k - 1) + (10 - 6*g)*H
+    b_ = (2*g - 4)*k**2 + 8*h*k + (2*g - 14*h - 4)*H - 8*h + 4*g - 6
+    c_ = (6*h + 2*g - 2)*k**2 + (4*h - 4*g + 6)*k + (2*h - 6)*H + 4*h
+    d_ = (2*h + 6)*k**2 - 4*h*k
+    sigma2 = (a_*N**3 + b_*N**2 + c_*N + d_) / ((N - 1.0)*(N - 2.0)*(N - 3.0))
+    return D, p, float((A2 - (k - 1)) / np.sqrt(sigma2))
+
+
+def _pair_rows(keys, samples, i, hcum):
+    """Report rows of the pairs (keys[i], T2) for the later horizons T2"""
+    rows = []
+    for T2 in keys[i + 1:]:
+        a, b = samples[keys[i]], samples[T2]
+        if len(a) < 2 or len(b) < 2 or len(a) + len(b) < 4:
+            continue
+        D, p, ad = two_sample_tests(a, b, hcum)
+        rows.append({"T1": keys[i], "T2": T2, "n1": len(a), "n2": len(b), "ks": D, "ks_p": p, "ad": ad})
+    return rows
+
+
+def _shared_pair_rows(arrays, i):
+    """_pair_rows in a pool worker, from the samples published by time_invariance_report"""
+    keys = [int(k) for k in arrays["keys"]]
+    bounds = arrays["bounds"]
+    samples = {k: arrays["z"][bounds[j]:bounds[j + 1]] for j, k in enumerate(keys)}
+    return _pair_rows(keys, samples, i, arrays["hcum"])
+
+
+def time_invariance_report(z, T, horizons=None, workers=None):
+    """
+    KS and Anderson–Darling tests for every pair of horizons, one row per pair.
+
+    With workers > 1 the rows of each first horizon are computed in a process
+    pool; the sorted samples are published once in shared memory rather than
+    pickled to every worker.
+    """
+    samples = sorted_samples(z, T, horizons)
+    keys = sorted(samples)
+    sizes = sorted(len(v) for v in samples.values())
+    hcum = harmonic_sums(sum(sizes[-2:])) if len(sizes) > 1 else np.array([])
+    if workers is not None and workers > 1 and len(keys) > 2:
+        from shared_panel import SharedArrays, pool_map
+
+        arrays = {
+            "keys": np.array(keys, dtype=np.int64),
+            "bounds": np.cumsum([0] + [len(samples[k]) for k in keys]),
+            "z": np.concatenate([samples[k] for k in keys]),
+            "hcum": hcum,
+        }
+        with SharedArrays(arrays) as shared:
+            # the first horizons pair with the most others: hand them out first
+            parts = pool_map(_shared_pair_rows, shared.handle, range(len(keys) - 1), workers)
+    else:
+        parts = [_pair_rows(keys, samples, i, hcum) for i in range(len(keys) - 1)]
+    rows = [row for part in parts for row in part]
+    return pd.DataFrame(rows, columns=["T1", "T2", "n1", "n2", "ks", "ks_p", "ad"])
+
+
+def summarize(report, alpha=ALPHA):
+    """Summary of a report: mean and max KS distance, fraction of pairs rejected by each test"""
+    if len(report) == 0:
+        return {"ks_mean": None, "ks_max": None, "ks_reject_frac": None, "ad_reject_frac": None, "num_pairs": 0}
+    return {
+        "ks_mean": float(report["ks"].mean()),
+        "ks_max": float(report["ks"].max()),
+        "ks_reject_frac": float((report["ks_p"] < alpha).mean()),
+        "ad_reject_frac": float((report["ad"] > AD_CRITICAL_5PCT).mean()),
+        "num_pairs": int(len(report)),
+    }
+
+
+def main():
+    args = sys.argv[1:]
+    workers = int(args[args.index("--workers") + 1]) if "--workers" in args else None
+    paths = [a for a in args if not a.startswith("--") and a != str(workers)]
+    if paths:
+        df = pd.read_parquet(paths[0], columns=["T", "z"])
+    else:
+        from benchmark_cache import load_benchmark
+        df = load_benchmark(columns=["T", "z"])
+    report = time_invariance_report(df["z"], df["T"], workers=workers)
+    print(report.pivot(index="T1", columns="T2", values="ks").round(3).to_string(na_rep=""))
+    for k, v in summarize(report).items():
+        print(f"{k} = {v}")
+
+
+if __name__ == "__main__":
+    main()
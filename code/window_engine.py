@@ -0,0 +1,368 @@
+# window_engine.py - computes q-variance windows directly from price arrays
+# Same window semantics as data_loader.py / data_loader_csv.py, but vectorized
+# over each horizon (and over tickers, for panels) so that simulated paths never
+# have to go through a CSV file
+import numpy as np
+import pandas as pd
+
+HORIZONS = 5*(np.arange(26)+1)   # does 1 to 26 weeks, can also do [5, 10, 20, 40, 80, 160]
+SCALE = np.sqrt(252)
+COLUMNS = ["ticker", "date", "T", "sigma", "z"]
+RANGE_COLUMNS = ["sigma_pk", "sigma_gk", "sigma_rs"]   # Parkinson, Garman–Klass, Rogers–Satchell
+
+
+def log_returns(prices, log_prices=False):
+    """Daily log returns with NaNs dropped, as np.log(price).diff().dropna() in the loaders"""
+    prices = np.asarray(prices, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret = np.diff(prices if log_prices else np.log(prices))
+    keep = ~np.isnan(ret)
+    return ret[keep]
+
+
+def window_arrays(ret, horizons=HORIZONS):
+    """
+    Non-overlapping windows of length T for each horizon, as flat arrays.
+
+    Windows start at the first return and step by T; a trailing partial window
+    is discarded. Windows with non-finite or zero sigma are rejected, and z is
+    de-meaned over the kept windows of each horizon.
+
+    Returns
+    -------
+    T : ndarray of int
+    end : ndarray of int
+        Position of the last return of each window (i + T - 1 in the loaders).
+    sigma : ndarray
+        Annualized volatility of the window.
+    z : ndarray
+        Scaled, de-meaned log return of the window.
+    """
+    ret = np.asarray(ret, dtype=float)
+    out_T, out_end, out_sigma, out_z = [], [], [], []
+
+    for T in horizons:
+        T = int(T)
+        n = len(ret) // T
+        if n == 0:
+            continue
+        window = ret[:n*T].reshape(n, T)
+        x = window.sum(axis=1)   # total price change over the period
+        sigma = window.std(axis=1, ddof=0) * SCALE
+        z_raw = x / np.sqrt(T / 252.0)
+
+        # REJECT BAD WINDOWS
+        ok = np.isfinite(sigma) & (sigma > 0) & np.isfinite(z_raw)
+        if not ok.any():
+            continue
+
+        out_T.append(np.full(ok.sum(), T))
+        out_end.append((np.arange(n)*T + T - 1)[ok])
+        out_sigma.append(sigma[ok])
+        out_z.append(z_raw[ok] - z_raw[ok].mean())   # de-mean per horizon
+
+    if not out_T:
+        empty = np.array([])
+        return empty.astype(int), empty.astype(int), empty, empty
+    return (np.concatenate(out_T), np.concatenate(out_end),
+            np.concatenate(out_sigma), np.concatenate(out_z))
+
+
+def compute_windows(prices, ticker="Model", horizons=HORIZONS, dates=None, log_prices=False):
+    """
+    Window table for a single price series, in the dataset.parquet format.
+
+    Parameters
+    ----------
+    prices : array-like
+        Daily prices (e.g. the first output of simulate_regime_mixture_qvar).
+    ticker : str
+        Value of the ticker column.
+    horizons : array-like of int
+        Window lengths in trading days.
+    dates : array-like or None
+        Date label for each price row. If None the row number is used, as in
+        data_loader_csv.py.
+    log_prices : bool
+        If True, prices are already log prices.
+
+    Returns
+    -------
+    df : DataFrame
+        Columns ticker, date, T, sigma, z.
+    """
+    if np.ndim(prices) != 1:
+        raise ValueError(f"Expected a single price series, got shape {np.shape(prices)}; "
+                         "use compute_panel_windows for several series")
+    ret = log_returns(prices, log_prices)
+    T, end, sigma, z = window_arrays(ret, horizons)
+
+    # as in the loaders, the date is price.index[i + T - 1]
+    date = end if dates is None else np.asarray(dates)[end]
+
+    return pd.DataFrame({
+        "ticker": ticker,
+        "date": date,
+        "T": T,
+        "sigma": sigma,
+        "z": z,
+    }, columns=COLUMNS)
+
+
+def range_variances(log_open, log_high, log_low, log_close):
+    """
+    Daily range-based variance estimates from log open, high, low and close.
+
+    Parkinson (h - l)²/(4 ln 2), Garman–Klass ½(h - l)² - (2 ln 2 - 1)(c - o)²
+    and Rogers–Satchell (h - c)(h - o) + (l - c)(l - o), each an estimate of
+    the open-to-close variance of the day (overnight gaps are not seen). Days
+    with a non-finite price or no range (high == low, as in old index data
+    that only recorded closes) are NaN.
+
+    Returns
+    -------
+    {column: ndarray} with the RANGE_COLUMNS names.
+    """
+    o, h, l, c = (np.asarray(a, dtype=float) for a in (log_open, log_high, log_low, log_close))
+    hl = h - l
+    with np.errstate(invalid='ignore'):
+        est = {
+            "sigma_pk": hl**2 / (4 * np.log(2)),
+            "sigma_gk": 0.5 * hl**2 - (2 * np.log(2) - 1) * (c - o)**2,
+            "sigma_rs": (h - c) * (h - o) + (l - c) * (l - o),
+        }
+        bad = ~(np.isfinite(o) & np.isfinite(h) & np.isfinite(l) & np.isfinite(c)) | ~(hl > 0)
+    for v in est.values():
+        v[bad] = np.nan
+    return est
+
+
+# Many series at once: one flat array of log prices with a segment (ticker) code per row.
+# Windows are laid out inside each segment, so the prefix sums below are only ever
+# differenced within one ticker and nothing leaks across ticker boundaries
+
+def segment_window_arrays(log_prices, codes, horizons=HORIZONS, variance=None, extra=None):
+    """
+    window_arrays for many series in one vectorized pass per horizon.
+
+    Parameters
+    ----------
+    log_prices : ndarray
+        Log prices of all series, concatenated; rows of one series are
+        contiguous and in time order.
+    codes : ndarray of int
+        Segment number of each row (equal for the rows of one series).
+    horizons : array-like of int
+        Window lengths in trading days.
+    variance : ndarray or None
+        Optional realized variance of each row's day (e.g. the sum of squared
+        intraday returns). If given, sigma is the realized volatility
+        sqrt(mean variance of the T days)·√252 instead of the std of the
+        daily returns.
+    extra : dict or None
+        Optional {name: daily variance estimate of each row}, e.g. from
+        range_variances. Each becomes an extra volatility per window,
+        sqrt(mean estimate of the T days)·√252, computed alongside sigma; it is
+        NaN if a day of the window has no estimate. Windows are still kept or
+        rejected by sigma alone.
+
+    Returns
+    -------
+    seg : ndarray of int
+        Segment number of each window.
+    T, end, sigma, z : ndarray
+        As in window_arrays, with end counted from the start of the segment.
+        Windows are ordered by segment, then horizon, then time, matching the
+        per-ticker loop of the loaders.
+    extra_sigma : dict, only if extra is given
+        {name: volatility of each window} for the extra estimates.
+    """
+    log_prices = np.asarray(log_prices, dtype=float)
+    codes = np.asarray(codes)
+
+    # returns within a segment, NaNs dropped as in log_returns
+    with np.errstate(invalid='ignore'):
+        ret = np.diff(log_prices)
+    keep = (codes[1:] == codes[:-1]) & ~np.isnan(ret)
+    ret, rseg = ret[keep], codes[1:][keep]
+    # the variance of return k is that of the day it ends on
+    rvar = None if variance is None else np.asarray(variance, dtype=float)[1:][keep]
+
+    starts = np.flatnonzero(np.r_[True, rseg[1:] != rseg[:-1]]) if len(ret) else np.array([], dtype=int)
+    lengths = np.diff(np.r_[starts, len(ret)])
+    seg_of = rseg[starts]
+
+    # ±inf returns are kept out of the sums and flag their windows instead
+    finite = np.isfinite(ret)
+    r = np.where(finite, ret, 0.0)
+    cs1 = np.r_[0.0, np.cumsum(r)]
+    cs2 = np.r_[0.0, np.cumsum(r * r)]
+    if rvar is not None:
+        finite &= np.isfinite(rvar)
+        csv = np.r_[0.0, np.cumsum(np.where(finite, rvar, 0.0))]
+    csbad = np.r_[0, np.cumsum(~finite)]
+
+    # extra daily estimates: prefix sums of the finite ones, and of the days without one
+    extra = {} if extra is None else extra
+    cs_extra = {}
+    for name, est in extra.items():
+        est = np.asarray(est, dtype=float)[1:][keep]
+        has = np.isfinite(est)
+        cs_extra[name] = (np.r_[0.0, np.cumsum(np.where(has, est, 0.0))], np.r_[0, np.cumsum(~has)])
+
+    names = ["seg", "T", "end", "sigma", "z"] + list(extra)
+    out = {k: [] for k in names}
+    for T in horizons:
+        T = int(T)
+        nw = lengths // T
+        total = nw.sum()
+        if total == 0:
+            continue
+        which = np.repeat(np.arange(len(starts)), nw)
+        w = np.arange(total) - np.repeat(np.cumsum(nw) - nw, nw)
+        g = starts[which] + w * T
+
+        x = cs1[g + T] - cs1[g]   # total price change over the period
+        mean = x / T
+        if rvar is None:
+            var = np.clip((cs2[g + T] - cs2[g]) / T - mean**2, 0.0, None)
+        else:
+            var = np.clip((csv[g + T] - csv[g]) / T, 0.0, None)
+        sigma = np.sqrt(var) * SCALE
+        z_raw = x / np.sqrt(T / 252.0)
+
+        # REJECT BAD WINDOWS
+        ok = (csbad[g + T] == csbad[g]) & np.isfinite(sigma) & (sigma > 0) & np.isfinite(z_raw)
+        which, w, sigma, z_raw, g = which[ok], w[ok], sigma[ok], z_raw[ok], g[ok]
+
+        # de-mean per (segment, horizon)
+        zsum = np.bincount(which, weights=z_raw, minlength=len(starts))
+        zcnt = np.bincount(which, minlength=len(starts))
+        with np.errstate(invalid='ignore'):
+            z = z_raw - (zsum / zcnt)[which]
+
+        out["seg"].append(seg_of[which])
+        out["T"].append(np.full(len(z), T))
+        out["end"].append(w * T + T - 1)
+        out["sigma"].append(sigma)
+        out["z"].append(z)
+        for name, (cs, csmiss) in cs_extra.items():
+            mean_est = (cs[g + T] - cs[g]) / T
+            with np.errstate(invalid='ignore'):
+                out[name].append(np.where((csmiss[g + T] == csmiss[g]) & (mean_est > 0),
+                                          np.sqrt(np.clip(mean_est, 0.0, None)) * SCALE, np.nan))
+
+    if not out["T"]:
+        empty = np.array([])
+        out = {k: empty.astype(int) if k in ["seg", "T", "end"] else empty for k in names}
+    else:
+        out = {k: np.concatenate(v) for k, v in out.items()}
+        order = np.argsort(out["seg"], kind='stable')
+        out = {k: v[order] for k, v in out.items()}
+    base = tuple(out[k] for k in ["seg", "T", "end", "sigma", "z"])
+    if cs_extra:
+        return base + ({name: out[name] for name in extra},)
+    return base
+
+
+def compute_panel_windows(prices, horizons=HORIZONS, ticker="ticker", date="date", price="price",
+                          log_prices=False, variance=None, ohlc=None):
+    """
+    Window table for many tickers at once, in the dataset.parquet format.
+
+    prices is either a long table with columns (ticker, date, price), the rows
+    of each ticker in time order, or a wide panel indexed by date with one
+    column per ticker. Missing prices are dropped first (a wide panel has them
+    before a ticker lists), then each ticker gets exactly the windows of
+    compute_windows, dated by its own price rows. Tickers keep their order of
+    first appearance.
+
+    variance optionally names a column of the long table holding each day's
+    realized variance, used for sigma as in segment_window_arrays.
+
+    ohlc optionally names the (open, high, low) columns of a long table whose
+    price column holds the close. The windows are unchanged, with extra
+    columns sigma_pk, sigma_gk and sigma_rs: the Parkinson, Garman–Klass and
+    Rogers–Satchell volatilities of each window (see range_variances), NaN
+    for windows with a day lacking a usable range.
+    """
+    if {ticker, date, price} <= set(prices.columns):
+        long = prices[[ticker, date, price] + ([variance] if variance is not None else [])
+                      + (list(ohlc) if ohlc is not None else [])]
+    else:
+        panel = prices.sort_index()
+        long = (panel.rename_axis(date).reset_index()
+                .melt(id_vars=date, var_name=ticker, value_name=price)[[ticker, date, price]])
+    long = long[long[price].notna()]
+
+    codes, names = pd.factorize(long[ticker], sort=False)
+    order = np.argsort(codes, kind='stable')
+    codes = codes[order]
+    values = long[price].to_numpy(dtype=float)[order]
+    dates = long[date].to_numpy()[order]
+    if not log_prices:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = np.log(values)
+    rv = None if variance is None else long[variance].to_numpy(dtype=float)[order]
+    extra = None
+    if ohlc is not None:
+        o, h, l = (long[col].to_numpy(dtype=float)[order] for col in ohlc)
+        if not log_prices:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                o, h, l = np.log(o), np.log(h), np.log(l)
+        extra = range_variances(o, h, l, values)
+
+    out = segment_window_arrays(values, codes, horizons, rv, extra)
+    seg, T, end, sigma, z = out[:5]
+    first_row = np.searchsorted(codes, np.arange(len(names)))
+    df = pd.DataFrame({
+        "ticker": np.asarray(names, dtype=object)[seg],
+        "date": dates[first_row[seg] + end],   # price.index[i + T - 1] of each ticker
+        "T": T,
+        "sigma": sigma,
+        "z": z,
+    }, columns=COLUMNS)
+    if extra is not None:
+        for name, vol in out[5].items():
+            df[name] = vol
+    return df
+
+
+# Compact submission artifact: float64 log prices per ticker in a compressed .npz,
+# from which the scorer derives the windows itself
+
+def save_price_paths(path, paths, log_prices=False):
+    """
+    Write {ticker: prices} as compressed float64 log prices (e.g. prices.npz).
+
+    Much smaller than the window table, and scoring then uses the project's
+    own window semantics rather than whichever loader the submitter ran.
+    """
+    arrays = {}
+    for ticker, p in paths.items():
+        p = np.asarray(p, dtype=np.float64)
+        arrays[str(ticker)] = p if log_prices else np.log(p)
+    np.savez_compressed(path, **arrays)
+
+
+def load_price_paths(path):
+    """Read a save_price_paths file as {ticker: log prices}; no pickled objects are allowed"""
+    with np.load(path, allow_pickle=False) as npz:
+        return {ticker: npz[ticker] for ticker in npz.files}
+
+
+def windows_from_price_paths(paths, horizons=HORIZONS):
+    """Window table for {ticker: log prices}, all tickers in one segmented pass"""
+    if not paths:
+        return pd.DataFrame(columns=COLUMNS)
+    names = list(paths)
+    lengths = [len(paths[t]) for t in names]
+    values = np.concatenate([np.asarray(paths[t], dtype=np.float64) for t in names])
+    seg, T, end, sigma, z = segment_window_arrays(values, np.repeat(np.arange(len(names)), lengths), horizons)
+    return pd.DataFrame({
+        "ticker": np.asarray(names, dtype=object)[seg],
+        "date": end,   # row number, as in compute_windows without dates
+        "T": T,
+        "sigma": sigma,
+        "z": z,
+    }, columns=COLUMNS)
@@ -2,6 +2,8 @@
 import yfinance as yf
 import pandas as pd
 import numpy as np
+import sys
+import time
 from pathlib import Path
 
 HORIZONS = 5*(np.arange(26)+1)   # does 1 to 26 weeks, can also do [5, 10, 20, 40, 80, 160]
@@ -10,65 +12,90 @@ HORIZONS = 5*(np.arange(26)+1)   # does 1 to 26 weeks, can also do [5, 10, 20, 4
 TICKERS = ["MMM", "AOS", "ABT", "ACN", "ADBE", "AMD", "AES", "AFL", "A", "APD", "AKAM", "ALB", "ARE",              "ALGN", "LNT", "ALL", "GOOGL", "GOOG", "MO", "AMZN", "AEE", "AEP", "AXP", "AIG", "AMT",              "AMP", "AME", "AMGN", "APH", "ADI", "AON", "APA", "AAPL", "AMAT", "ACGL", "ADM", "AJG",              "AIZ", "T", "ATO", "ADSK", "ADP", "AZO", "AVB", "AVY", "AXON", "BKR", "BALL", "BAC", "BAX",              "BDX", "BBY", "TECH", "BIIB", "BLK", "BK", "BA", "BKNG", "BSX", "BMY", "BRO", "BLDR", "BG",              "BXP", "CHRW", "CDNS", "CPT", "CPB", "COF", "CAH", "CCL", "CAT", "CBRE", "COR", "CNC", "CNP",              "CF", "CRL" , "SCHW", "CVX", "CMG", "CB", "CHD", "CI", "CINF", "CTAS", "CSCO", "C", "CLX",              "CME", "CMS" , "KO", "CTSH", "CL", "CMCSA", "CAG", "COP", "ED", "STZ", "COO", "CPRT", "GLW",              "CSGP", "COST", "CTRA", "CCI", "CSX", "CMI", "CVS", "DHR", "DRI", "DVA", "DECK", "DE", "DVN",              "DXCM", "DLR", "DLTR", "D", "DPZ", "DOV", "DHI", "DTE", "DUK", "DD", "ETN", "EBAY", "ECL",              "EIX", "EW", "EA", "ELV", "EME", "EMR", "ETR", "EOG", "EQT", "EFX", "EQIX", "EQR", "ERIE",              "ESS", "EL", "EG", "EVRG", "ES", "EXC", "EXPE", "EXPD", "EXR", "XOM", "FFIV", "FDS", "FICO",              "FAST", "FRT", "FDX", "FIS", "FITB", "FSLR", "FE", "FISV", "F", "BEN", "FCX", "GRMN", "IT",              "GE", "GEN", "GD", "GIS", "GPC", "GILD", "GPN", "GL", "GS", "HAL", "HIG", "HAS", "DOC",              "HSIC", "HSY", "HOLX", "HD", "HON", "HRL", "HST", "HPQ", "HUBB", "HUM", "HBAN", "IBM", "IEX",              "IDXX", "ITW", "INCY", "INTC", "ICE", "IFF", "IP", "INTU", "ISRG", "IVZ", "IRM", "JBHT", "JBL",              "JKHY", "J", "JNJ", "JCI", "JPM", "K", "KEY", "KMB", "KIM", "KLAC", "KR", "LHX", "LH", "LRCX",              "LVS", "LDOS", "LEN", "LII", "LLY", "LIN", "LYV", "LKQ", "LMT", "L", "LOW", "MTB", "MAR",              "MMC", "MLM", "MAS", "MA", "MTCH", "MKC", "MCD", "MCK", "MDT", "MRK", "MET", "MTD", "MGM",              "MCHP", "MU", "MSFT", "MAA", "MHK", "MOH", "TAP", "MDLZ", "MPWR", "MNST", "MCO", "MS", "MOS",              "MSI", "NDAQ", "NTAP", "NFLX", "NEM", "NEE", "NKE", "NI", "NDSN", "NSC", "NTRS", "NOC", "NRG",              "NUE", "NVDA", "NVR", "ORLY", "OXY", "ODFL", "OMC", "ON", "OKE", "ORCL", "PCAR", "PKG",              "PSKY", "PH", "PAYX", "PNR", "PEP", "PFE", "PCG", "PNW", "PNC", "POOL", "PPG", "PPL", "PFG",              "PG", "PGR", "PLD", "PRU", "PEG", "PTC", "PSA", "PHM", "PWR", "QCOM", "DGX", "RL", "RJF",              "RTX", "O", "REG", "REGN", "RF", "RSG", "RMD", "RVTY", "ROK", "ROL", "ROP", "ROST", "RCL",              "SPGI", "CRM", "SBAC", "SLB", "STX", "SRE", "SHW", "SPG", "SWKS", "SJM", "SNA", "SO", "LUV",              "SWK", "SBUX", "STT", "STLD", "STE", "SYK", "SNPS", "SYY", "TROW", "TTWO", "TPR", "TGT",              "TDY", "TER", "TXN", "TPL", "TXT", "TMO", "TJX", "TKO", "TSCO", "TT", "TDG", "TRV", "TRMB",              "TFC", "TYL", "TSN", "USB", "UDR", "UNP", "UAL", "UPS", "URI", "UNH", "UHS", "VLO", "VTR",              "VRSN", "VZ", "VRTX", "VTRS", "VMC", "WRB", "GWW", "WAB", "WMT", "DIS", "WBD", "WM", "WAT",              "WEC", "WFC", "WELL", "WST", "WDC", "WY", "WSM", "WMB", "WTW", "WYNN", "XEL", "YUM", "ZBRA", "ZBH"]
 ntick = len(TICKERS)
 
+RANGE_ESTIMATORS = False             # also add Parkinson, Garman–Klass, Rogers–Satchell sigmas
+CHUNK_TICKERS = 50                   # tickers per download; each finished chunk is checkpointed
+CHECKPOINT_DIR = "loader_checkpoint"  # rerun after a failure to resume from the last chunk
+DOWNLOAD_RETRIES = 3                 # further attempts for tickers that come back without data
+
 # Path("cache").mkdir(exist_ok=True)
-all_data = []
+sys.path.insert(0, str(Path(__file__).parent / 'code'))
+from checkpoint import Checkpoint
+from window_engine import COLUMNS, compute_panel_windows
+
+def no_close(data, tickers):
+    """Tickers without a single close: yf.download reports a failed ticker as all-NaN columns, not an error"""
+    close = data["Close"] if "Close" in data else pd.DataFrame()
+    return [t for t in tickers if t not in close.columns or close[t].isna().all()]
+
+def transient(failed):
+    """Failed tickers worth retrying: yfinance keeps the last call's error per ticker, and a delisting is final"""
+    errors = getattr(yf.shared, "_ERRORS", {})
+    return [t for t in failed if "delisted" not in str(errors.get(t, "")).lower()]
+
+def download(chunk):
+    """Download a chunk, retrying tickers that come back empty; delisted tickers are kept as no data"""
+    data = yf.download(chunk, period="max", progress=False, auto_adjust=True)
+    failed = no_close(data, chunk)
+    for attempt in range(DOWNLOAD_RETRIES):
+        failed = transient(failed)
+        if not failed:
+            break
+        time.sleep(2**attempt)
+        retry = yf.download(failed, period="max", progress=False, auto_adjust=True)
+        got = [t for t in failed if t not in no_close(retry, failed)]
+        if got:
+            data = pd.concat([data.loc[:, ~data.columns.get_level_values(-1).isin(got)],
+                              retry.loc[:, retry.columns.get_level_values(-1).isin(got)]], axis=1)
+        failed = [t for t in failed if t not in got]
+    # the chunk is not checkpointed, so a rerun tries it again
+    failed = transient(failed)
+    if failed:
+        errors = getattr(yf.shared, "_ERRORS", {})
+        raise RuntimeError(f"No data for {', '.join(failed)} after {DOWNLOAD_RETRIES} retries "
+                           f"({'; '.join(str(errors.get(t, 'empty')) for t in failed)}); rerun to resume")
+    return data
 
 print("Generating Q-Variance Challenge Dataset...")
 
-for ticker in TICKERS:
-    print(f"→ {ticker}", end="")
-    price = yf.download(ticker, period="max", progress=False, auto_adjust=True)["Close"]
-    
-    ret = np.log(price).diff().dropna().values
-
-    rows = []
-    scale = np.sqrt(252)
-
-    for T in HORIZONS:
-        i = 0
-        while i + T <= len(ret):
-            window = ret[i:i+T]     # T points
-            if len(window) < T * 0.8:
-                break
-
-            x = window.sum()   # total price change over the period
-            sigma = np.std(window, ddof=0) * scale  # use np.std to get std over period, ddof=1 means divisor is N-1
-            z_raw = x / np.sqrt(T / 252.0)
-
-            # REJECT BAD WINDOWS
-            if not (np.isfinite(sigma) and sigma > 0 and np.isfinite(z_raw)):
-                i += T
-                continue
-
-            rows.append({          # append row of data for this period
-                "ticker": ticker,
-                "date": price.index[i + T - 1].date(),
-                "T": T,
-                "z_raw": float(z_raw),
-                "sigma": float(sigma)
-            })
-            i += T
-
-    if not rows:
-        print(" [no data]")
-        continue
-
-    df = pd.DataFrame(rows)
-
-    # CLEAN BEFORE DE-MEANING 
-    df = df[np.isfinite(df['z_raw']) & np.isfinite(df['sigma']) & (df['sigma'] > 0)]
-
-    # NOW de-mean safely, this step groups by ticker and T, and subtracts the group mean 
-    df["z"] = df.groupby(["ticker", "T"])["z_raw"].transform(lambda g: g - g.mean())
-
-    df = df.drop(columns="z_raw")
-    df = df.dropna().reset_index(drop=True)  # Final clean
-
-    #df.to_parquet(Path("cache") / f"{ticker}.parquet")
-    print(f" → {len(df)} clean windows")
-    all_data.append(df)
-
-full = pd.concat(all_data, ignore_index=True)
+ckpt = Checkpoint(CHECKPOINT_DIR, key={"tickers": TICKERS, "horizons": HORIZONS.tolist(), "chunk": CHUNK_TICKERS,
+                                     "range": RANGE_ESTIMATORS})
+resumed = ckpt.load()
+done = resumed[0]["done"] if resumed else 0
+if done:
+    print(f"Resuming after {done} of {ntick} tickers")
+
+for start in range(done, ntick, CHUNK_TICKERS):
+    chunk = TICKERS[start:start + CHUNK_TICKERS]
+    data = download(chunk)
+
+    # all tickers and horizons of the chunk in one segmented pass: windows never cross ticker
+    # boundaries, bad windows are rejected and z is de-meaned per (ticker, T) as in the old loop
+    if RANGE_ESTIMATORS:
+        # long table of daily OHLC, tickers in TICKERS order; rows without a close are dropped
+        ohlc = data[["Open", "High", "Low", "Close"]].stack(level=1, future_stack=True)
+        ohlc = ohlc.rename_axis(["date", "ticker"]).reset_index()
+        ohlc = ohlc[ohlc["ticker"].isin(chunk)]
+        rank = ohlc["ticker"].map({t: i for i, t in enumerate(chunk)}).to_numpy()
+        ohlc = ohlc.iloc[np.lexsort((ohlc["date"].to_numpy(), rank))]
+        windows = compute_panel_windows(ohlc, horizons=HORIZONS, price="Close", ohlc=("Open", "High", "Low"))
+    else:
+        # one wide panel of closes (date x ticker); NaN before a ticker lists is dropped per ticker
+        prices = data["Close"]
+        prices = prices[[t for t in chunk if t in prices.columns]]   # keep the TICKERS order
+        windows = compute_panel_windows(prices, horizons=HORIZONS)
+    windows["date"] = pd.to_datetime(windows["date"]).dt.date
+    ckpt.save({"done": start + len(chunk)}, windows=windows)
+    print(f"{start + len(chunk)} of {ntick} tickers")
+
+# always assembled from the saved chunks, so a resumed build is identical to an uninterrupted one
+full = pd.concat(ckpt.load()[1]["windows"], ignore_index=True)
+full = full.dropna(subset=COLUMNS).reset_index(drop=True)  # Final clean; range columns may be NaN
+
+counts = full.groupby("ticker", sort=False).size()
+print(f"{len(counts)} of {ntick} tickers → {len(full)} clean windows")
+missing = sorted(set(TICKERS) - set(counts.index))
+if missing:
+    print(f"[no data] {', '.join(missing)}")
 
 n = len(full) // 3
 part1 = full.iloc[:n]
@@ -80,4 +107,5 @@ part1.to_parquet("dataset_part1.parquet", compression=None)
 part2.to_parquet("dataset_part2.parquet", compression=None)
 part3.to_parquet("dataset_part3.parquet", compression=None)
 
+ckpt.clear()
 print("Done! 3 files created — each <25 MB")
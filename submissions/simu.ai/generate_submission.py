@@ -2,16 +2,21 @@
 Generate submission for Q-Variance Challenge
 
 This script:
-1. Simulates price data using the regime mixture Q-variance model
-2. Processes the CSV through data_loader_csv.py to generate dataset.parquet
-3. Scores the submission using score_submission.py
+1. Simulates price data using the regime mixture Q-variance model, computes the
+   windows and scores them in memory (code/qvar_pipeline.py), writing dataset.parquet
+2. Generates the submission figures from the same windows
+
+Each stage (simulation, windows, score, figures) is cached in .stage_cache/ under a
+hash of its settings and inputs, so e.g. a plotting change only redraws the figures.
+Run with --no-cache to recompute everything. The simulation is checkpointed in
+.checkpoint/ while it runs, so an interrupted run picks up where it stopped.
 """
 import os
 os.environ["MPLBACKEND"] = "Agg"  
 
 
 import sys
-import subprocess
+import tempfile
 import numpy as np
 import pandas as pd
 from pathlib import Path
@@ -30,13 +35,19 @@ from sklearn.metrics import r2_score
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'code'))
 
-from model_simulation import generate_price_csv
+import model_simulation
+import qvar_bins
+import qvar_pipeline
+import window_engine
+from model_simulation import simulate_regime_mixture_qvar
+from qvar_bins import BASELINE_POPT, BINS
+from qvar_pipeline import run_adaptive, score_windows, simulate_prices
+from stage_cache import StageCache, source_digest
+from window_engine import HORIZONS, compute_windows
 
 # Configuration
 SUBMISSION_DIR = Path(__file__).parent
 CHALLENGE_ROOT = Path(__file__).parent.parent.parent
-DATA_LOADER_SCRIPT = CHALLENGE_ROOT / 'code' / 'data_loader_csv.py'
-SCORE_SCRIPT = CHALLENGE_ROOT / 'code' / 'score_submission.py'
 
 # Model parameters for regime mixture Q-variance model
 # Based on the model structure: σ²(z) = σ₀² + (z - z₀)²/2
@@ -47,6 +58,21 @@ N_DAYS = 5_000_000    # Number of trading days to simulate
 SAMPLES_PER_DAY = 4   # Internal steps per day for simulation granularity
 MAX_WINDOW_DAYS = 130 # Maximum window size in days (for regime length heuristic)
 
+# Adaptive mode (run with --adaptive): simulate in blocks until the R² is pinned down,
+# instead of a fixed N_DAYS
+ADAPTIVE = '--adaptive' in sys.argv
+BLOCK_DAYS = 250_000      # Days per simulation block
+R2_CI_WIDTH = 0.002       # Stop when the 95% interval of R² is narrower than this
+MAX_DAYS = 20_000_000     # Upper limit on simulated days
+
+# Stage cache (disable with --no-cache)
+USE_CACHE = '--no-cache' not in sys.argv
+CACHE_DIR = SUBMISSION_DIR / '.stage_cache'
+CACHE_MAX_BYTES = 2 * 1024**3   # least recently used entries are evicted above this
+
+# Checkpoints of the long simulation; an interrupted run resumes from the last one
+CHECKPOINT_DIR = SUBMISSION_DIR / '.checkpoint'
+
 # Note: The model uses regime-switching variance with Gamma-distributed precision
 # Regime lengths are geometric with mean ≈ 10 * max_window_days
 
@@ -69,13 +95,12 @@ def quantum_density(z, sig0, zoff=0.0):
     return qdn
 
 
-def generate_figures(dataset_path, output_dir):
-    """Generate Figure_1.png and Figure_5.png for the submission"""
-    print(f"Loading dataset from {dataset_path}...")
-    data = pd.read_parquet(dataset_path)
+def generate_figures(windows, output_dir):
+    """Generate Figure_1.png and Figure_5.png for the submission from a window table"""
+    data = windows.copy()
     data["var"] = data.sigma**2
     
-    print(f"Loaded {len(data)} windows")
+    print(f"Using {len(data)} windows")
     
     # ===== Figure 1: Q-Variance scatter plot =====
     print("Generating Figure_1.png...")
@@ -176,37 +201,6 @@ def generate_figures(dataset_path, output_dir):
     print(f"  Saved to {figure5_path}")
 
 
-def run_data_loader():
-    """Run data_loader_csv.py to process the CSV and generate dataset.parquet"""
-    print("\n" + "="*60)
-    print("Step 2: Processing CSV through data_loader_csv.py")
-    print("="*60)
-    
-    # Change to challenge root directory
-    os.chdir(CHALLENGE_ROOT)
-    
-    # The data_loader_csv.py expects variance_timeseries.csv in the current directory
-    # and will create dataset.parquet
-    result = subprocess.run(
-        [sys.executable, str(DATA_LOADER_SCRIPT)],
-        capture_output=True,
-        text=True
-    )
-    
-    print(result.stdout)
-    if result.stderr:
-        print("Errors:", result.stderr)
-    
-    # Move dataset.parquet to submission directory
-    dataset_file = CHALLENGE_ROOT / 'dataset.parquet'
-    if dataset_file.exists():
-        target = SUBMISSION_DIR / 'dataset.parquet'
-        dataset_file.rename(target)
-        print(f"\nMoved dataset.parquet to {target}")
-    else:
-        print("Warning: dataset.parquet was not created")
-
-
 def main():
     """Main execution function"""
     print("="*60)
@@ -216,62 +210,84 @@ def main():
     
     # Step 1: Generate price simulation
     print("\n" + "="*60)
-    print("Step 1: Generating price simulation")
+    print("Step 1: Simulating, windowing and scoring")
     print("="*60)
     print(f"Parameters: σ₀ = {SIGMA0:.4f}, μ = {MU:.4f}")
-    print(f"Simulating {N_DAYS:,} days (~{N_DAYS/252:.1f} years)")
+    if ADAPTIVE:
+        print(f"Simulating blocks of {BLOCK_DAYS:,} days until the R² interval is narrower than {R2_CI_WIDTH}")
+    else:
+        print(f"Simulating {N_DAYS:,} days (~{N_DAYS/252:.1f} years)")
     print(f"Samples per day: {SAMPLES_PER_DAY}, Max window: {MAX_WINDOW_DAYS} days")
     
-    # Generate CSV in challenge root (where data_loader_csv.py expects it)
-    csv_file = CHALLENGE_ROOT / 'variance_timeseries.csv'
-    generate_price_csv(
+    # Simulate, compute windows and score in memory; every stage is looked up in the
+    # cache first, keyed by its settings and the content of its inputs
+    cache = StageCache(CACHE_DIR, CACHE_MAX_BYTES, enabled=USE_CACHE)
+    dataset_file = SUBMISSION_DIR / 'dataset.parquet'
+    params = dict(
         sigma0=SIGMA0,
         mu=MU,
-        n_days=N_DAYS,
         samples_per_day=SAMPLES_PER_DAY,
         max_window_days=MAX_WINDOW_DAYS,
-        output_file=str(csv_file),
-        seed=42  # For reproducibility
     )
-    
-    # Step 2: Process through data_loader_csv.py
-    run_data_loader()
-    
-    # Step 3: Score the submission
-    print("\n" + "="*60)
-    print("Step 3: Scoring submission")
-    print("="*60)
-    
-    # Modify score_submission.py temporarily to read from submission directory
-    # Or copy dataset.parquet to challenge root for scoring
-    dataset_file = SUBMISSION_DIR / 'dataset.parquet'
-    if dataset_file.exists():
-        # Copy to challenge root for scoring
-        import shutil
-        temp_dataset = CHALLENGE_ROOT / 'dataset.parquet'
-        shutil.copy(dataset_file, temp_dataset)
-        
-        # Run scoring
-        os.chdir(CHALLENGE_ROOT)
-        result = subprocess.run(
-            [sys.executable, str(SCORE_SCRIPT)],
-            capture_output=True,
-            text=True
-        )
-        
-        print(result.stdout)
-        if result.stderr:
-            print("Errors:", result.stderr)
-        
-        # Clean up temp file
-        if temp_dataset.exists():
-            temp_dataset.unlink()
-    
-    # Step 4: Generate figures
+    # whole-module digests, so that module constants (e.g. N_STRATA) and helpers count as well
+    simulator = {'simulator': simulate_regime_mixture_qvar.__name__,
+                 'source': source_digest(model_simulation)}
+    # the windowing and scoring stages depend on whole modules, not a single entry point
+    code = {m.__name__: source_digest(m) for m in (window_engine, qvar_bins, qvar_pipeline)}
+    if ADAPTIVE:
+        # the adaptive run interleaves simulating and scoring, so it is one stage
+        stage = dict(simulator, code=code, **params, block_days=BLOCK_DAYS, target_width=R2_CI_WIDTH,
+                     max_days=MAX_DAYS, seed=42, horizons=HORIZONS.tolist())
+        adaptive = {}
+
+        def run():
+            adaptive['result'], w = run_adaptive(
+                simulate_regime_mixture_qvar,
+                params,
+                block_days=BLOCK_DAYS,
+                target_width=R2_CI_WIDTH,
+                max_days=MAX_DAYS,
+                seed=42,  # For reproducibility
+                return_windows=True
+            )
+            return w
+
+        windows, windows_digest = cache.run('adaptive-windows', stage, [], run, 'frame')
+        result, _ = cache.run('adaptive-result', stage, [windows_digest],
+                              lambda: adaptive.get('result') or score_windows(windows), 'json')
+        if 'n_days' in result:
+            print(f"Stopped after {result['n_days']:,} days (~{result['n_days']/252:.1f} years): {result['stop_reason']}")
+            print(f"R² 95% interval: [{result['r2_ci'][0]:.5f}, {result['r2_ci'][1]:.5f}]")
+    else:
+        sim_params = dict(params, n_days=N_DAYS, seed=42)  # seed for reproducibility
+        prices, prices_digest = cache.run(
+            'simulate', dict(simulator, **sim_params), [],
+            lambda: simulate_prices(simulate_regime_mixture_qvar, dict(sim_params, checkpoint=CHECKPOINT_DIR)),
+            'array')
+        windows, windows_digest = cache.run(
+            'windows', {'horizons': HORIZONS.tolist(), 'code': code}, [prices_digest],
+            lambda: compute_windows(prices, ticker="Model", horizons=HORIZONS), 'frame')
+        result, _ = cache.run(
+            'score', {'bins': BINS.tolist(), 'popt': BASELINE_POPT, 'code': code}, [windows_digest],
+            lambda: score_windows(windows), 'json')
+    windows.to_parquet(dataset_file, compression=None)
+    print(f"Saved {len(windows)} windows to {dataset_file}")
+    print(f"σ₀ = {result['sigma0']:.4f}  zoff = {result['zoff']:.4f}  R² = {result['r2']:.4f}  ({result['status']})")
+    
+    # Step 2: Generate figures
     print("\n" + "="*60)
-    print("Step 4: Generating figures")
+    print("Step 2: Generating figures")
     print("="*60)
-    generate_figures(SUBMISSION_DIR / 'dataset.parquet', SUBMISSION_DIR)
+    def draw():
+        # render into a scratch directory so the cached bytes are exactly the files written
+        with tempfile.TemporaryDirectory() as scratch:
+            generate_figures(windows, Path(scratch))
+            return {name: (Path(scratch) / name).read_bytes() for name in ['Figure_1.png', 'Figure_5.png']}
+
+    figure_code = dict(code, figures=source_digest(sys.modules[__name__]))
+    figures, _ = cache.run('figures', {'code': figure_code}, [windows_digest], draw, 'files')
+    for name, data in figures.items():
+        (SUBMISSION_DIR / name).write_bytes(data)
     
     print("\n" + "="*60)
     print("Submission generation complete!")
@@ -10,11 +10,30 @@ Model:
 - Regime lengths follow geometric distribution
 
 Parameters: (σ₀, μ, n_days, samples_per_day)
+
+Variance reduction for scoring: antithetic paths (same regimes, mirrored
+Gaussian draws) and a control variate built from the known regime variances,
+see simulate_qvar_windows(). Stratified sampling of the regime precisions is
+also available, but it has not been shown to reduce the variance of the
+binned curve.
 """
 
+import sys
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
 
+CHALLENGE_CODE = Path(__file__).parent.parent.parent / 'code'
+N_STRATA = 64   # regimes per stratification block (stratified_regimes=True)
+CHECKPOINT_EVERY_DAYS = 250_000   # simulated days between checkpoints (checkpoint=...)
+
+
+def _use_challenge_code():
+    """Make the challenge code (window engine, bin accumulators, checkpoints) importable"""
+    if str(CHALLENGE_CODE) not in sys.path:
+        sys.path.insert(0, str(CHALLENGE_CODE))
+
 
 def simulate_regime_mixture_qvar(
     sigma0,
@@ -25,6 +44,10 @@ def simulate_regime_mixture_qvar(
     max_window_days=None,
     mean_reversion_rate=0.001,
     seed=None,
+    antithetic=False,
+    stratified_regimes=False,
+    checkpoint=None,
+    checkpoint_every_days=CHECKPOINT_EVERY_DAYS,
 ):
     """
     Long log-price path with piecewise-constant variance regimes.
@@ -63,17 +86,43 @@ def simulate_regime_mixture_qvar(
         Set to 0.0 to disable mean reversion. We apply mean reversion to prevent
         overflow errors when exponentiating long log-price paths.
     seed : int or None
+    antithetic : bool
+        If True, also return the antithetic path driven by the same regimes
+        and the negated Gaussian draws -eps. It costs no extra loop: the
+        recursion is linear, so L + L_anti is deterministic. The two rows are
+        separate series: window them separately (as simulate_qvar_windows does),
+        not as one flattened path.
+    stratified_regimes : bool
+        If True, draw tau by stratified sampling: each consecutive block of
+        N_STRATA regimes gets exactly one draw from every 1/N_STRATA quantile
+        band of the Gamma distribution. The marginal law is unchanged and the
+        number of rare high-variance regimes no longer fluctuates, but the
+        effect on the variance of the binned curve is not settled: over 16
+        seeds the per-bin ratios are within the noise of the comparison.
+    checkpoint : str, Path or None
+        Directory for periodic checkpoints (the path so far, the RNG state,
+        the current regime variance and the last log price). If it holds a
+        checkpoint of a run with the same parameters, the simulation resumes
+        from there, and the output is bit-identical to an uninterrupted run.
+        The checkpoint is removed once the path is complete. An unseeded run
+        gets a fresh seed, printed so the run can be resumed with it.
+    checkpoint_every_days : int
+        Simulated days between checkpoints; they are taken at regime switches.
 
     Returns
     -------
-    prices_daily : ndarray, shape (n_days+1,)
-        Price path sampled once per day.
-    log_prices_daily : ndarray, shape (n_days+1,)
+    prices_daily : ndarray, shape (n_days+1,), or (2, n_days+1) if antithetic
+        Price path sampled once per day (row 1 is the antithetic path).
+    log_prices_daily : ndarray, shape (n_days+1,), or (2, n_days+1) if antithetic
         Log-price path sampled once per day.
     V_daily : ndarray, shape (n_days,)
         Average variance rate per day (mean of internal V over that day).
     """
 
+    if checkpoint is not None and seed is None:
+        # every unseeded run would otherwise resume the checkpoint of another one
+        seed = np.random.SeedSequence().entropy
+        print(f"Checkpointing an unseeded run; pass seed={seed} to resume it")
     rng = np.random.default_rng(seed)
 
     # --- internal grid ---
@@ -100,7 +149,19 @@ def simulate_regime_mixture_qvar(
     alpha = 3/2                      # shape
     beta = sigma0**2                 # rate
     # tau ~ Gamma(alpha, rate=beta) => in numpy: scale=1/beta
-    tau = rng.gamma(shape=alpha, scale=1.0 / beta)
+    tau_buffer = []
+    if stratified_regimes:
+        from scipy.stats import gamma as gamma_dist
+
+    def draw_tau():
+        if not stratified_regimes:
+            return rng.gamma(shape=alpha, scale=1.0 / beta)
+        if not tau_buffer:
+            u = (rng.permutation(N_STRATA) + rng.random(N_STRATA)) / N_STRATA
+            tau_buffer.extend(gamma_dist.ppf(u, alpha, scale=1.0 / beta))
+        return tau_buffer.pop()
+
+    tau = draw_tau()
     V = 1.0 / tau
 
     # drift per internal step
@@ -110,8 +171,29 @@ def simulate_regime_mixture_qvar(
     # Mean reversion rate per internal step
     theta_step = mean_reversion_rate * dt_step
 
-    remaining = n_steps
     t = 0
+    saved_t = 0
+    ckpt = None
+    if checkpoint is not None:
+        _use_challenge_code()
+        from checkpoint import Checkpoint
+        ckpt = Checkpoint(checkpoint, key=dict(
+            sigma0=sigma0, mu=mu, n_days=n_days, samples_per_day=samples_per_day,
+            mean_regime_length_days=mean_regime_length_days, mean_reversion_rate=mean_reversion_rate,
+            seed=repr(seed), stratified_regimes=stratified_regimes))
+        resumed = ckpt.load()
+        if resumed is not None:
+            state, shards = resumed
+            t = saved_t = state["t"]
+            L[1:t+1] = np.concatenate(shards["L"])
+            V_path[:t] = np.concatenate(shards["V"])
+            L[t] = state["log_price"]
+            V = state["V"]
+            tau_buffer[:] = state["tau_buffer"]
+            rng.bit_generator.state = state["rng"]
+            print(f"Resuming from checkpoint at day {t // samples_per_day:,}")
+
+    remaining = n_steps - t
     while remaining > 0:
         # sample regime length in internal steps
         L_reg = rng.geometric(p_switch)
@@ -132,17 +214,37 @@ def simulate_regime_mixture_qvar(
 
         if remaining > 0:
             # new regime: resample tau, hence V
-            tau = rng.gamma(shape=alpha, scale=1.0 / beta)
+            tau = draw_tau()
             V = 1.0 / tau
 
+            # checkpoint between regimes: the next draw is the next regime's length
+            if ckpt is not None and t - saved_t >= checkpoint_every_days * samples_per_day:
+                state = {"t": t, "log_price": L[t], "V": V, "tau_buffer": tau_buffer,
+                         "rng": rng.bit_generator.state}
+                ckpt.save(state, L=L[saved_t+1:t+1], V=V_path[saved_t:t])
+                saved_t = t
+
+    if ckpt is not None:
+        ckpt.clear()
+
+    if antithetic:
+        # L_anti[t+1] = (1 - theta) L_anti[t] + mu_step - sqrt(V dt) eps, so the sum
+        # D = L + L_anti obeys D[t+1] = (1 - theta) D[t] + 2 mu_step with D[0] = 0
+        k = np.arange(n_steps + 1)
+        if theta_step > 0:
+            D = 2 * mu_step * (1 - (1 - theta_step)**k) / theta_step
+        else:
+            D = 2 * mu_step * k
+        L = np.vstack([L, D - L])
+
     # --- downsample to one value per *day* ---
     step = samples_per_day
-    L_daily = L[::step]                    # length n_days+1
+    L_daily = L[..., ::step]               # length n_days+1
     prices_daily = np.exp(L_daily)
 
     # daily average variance over internal steps
     if samples_per_day > 1:
-        n_days_eff = len(L_daily) - 1      # should be n_days
+        n_days_eff = L_daily.shape[-1] - 1 # should be n_days
         V_daily = V_path[:n_days_eff*step].reshape(n_days_eff, step).mean(axis=1)
     else:
         V_daily = V_path
@@ -150,7 +252,8 @@ def simulate_regime_mixture_qvar(
     return prices_daily, L_daily, V_daily
 
 
-def simulate_price_path(sigma_f, sigma_n, mu=0.0, S0=100.0, dt=1/252, n_steps=50000, seed=None):
+def simulate_price_path(sigma_f, sigma_n, mu=0.0, S0=100.0, dt=1/252, n_steps=50000, seed=None,
+                        antithetic=False, n_days=None):
     """
     Simulate a price path using the two-factor Gaussian diffusion model.
     
@@ -170,33 +273,40 @@ def simulate_price_path(sigma_f, sigma_n, mu=0.0, S0=100.0, dt=1/252, n_steps=50
         Number of time steps to simulate
     seed : int, optional
         Random seed for reproducibility
+    antithetic : bool
+        If True, also return the path driven by the negated normals
+        (default: False)
+    n_days : int, optional
+        Alias of n_steps (one step per day at the default dt), the name used
+        by run_pipeline / run_adaptive in code/qvar_pipeline.py
     
     Returns:
     --------
     prices : ndarray
-        Array of prices S_n = exp(L_n)
+        Array of prices S_n = exp(L_n); shape (2, n_steps+1) if antithetic
     log_prices : ndarray
-        Array of log-prices L_n
+        Array of log-prices L_n; shape (2, n_steps+1) if antithetic
     """
+    if n_days is not None:
+        n_steps = n_days
     if seed is not None:
         np.random.seed(seed)
     
-    # Initialize
-    X = np.zeros(n_steps + 1)  # Fundamental component
-    N = np.zeros(n_steps + 1)  # Noise component
-    L = np.zeros(n_steps + 1)  # Log-price
-    L[0] = np.log(S0)
-    
     # Generate independent standard normals
     xi_f = np.random.randn(n_steps)  # Fundamental noise
     xi_n = np.random.randn(n_steps)  # Noise component
     
-    # Simulate using discrete-time equations
+    # Simulate using discrete-time equations, all steps at once
+    # (the batched version for many paths is the "two_factor" model in code/models.py)
     sqrt_dt = np.sqrt(dt)
-    for n in range(n_steps):
-        X[n+1] = X[n] + sigma_f * sqrt_dt * xi_f[n]
-        N[n+1] = N[n] + sigma_n * sqrt_dt * xi_n[n]
-        L[n+1] = L[n] + mu * dt + sigma_f * sqrt_dt * xi_f[n] + sigma_n * sqrt_dt * xi_n[n]
+    L = np.empty(n_steps + 1)  # Log-price
+    L[0] = np.log(S0)
+    L[1:] = L[0] + np.cumsum(mu * dt + sigma_f * sqrt_dt * xi_f + sigma_n * sqrt_dt * xi_n)
+    
+    if antithetic:
+        # mirror image about the deterministic drift line
+        drift = L[0] + mu * dt * np.arange(n_steps + 1)
+        L = np.vstack([L, 2 * drift - L])
     
     # Convert to prices
     prices = np.exp(L)
@@ -204,6 +314,248 @@ def simulate_price_path(sigma_f, sigma_n, mu=0.0, S0=100.0, dt=1/252, n_steps=50
     return prices, L
 
 
+def expected_window_variance(log_prices_daily, V_daily, T, end, mu=0.0):
+    """
+    E[σ² | regime variances, x] for each window, the control variate for σ².
+
+    Given the daily variances s_i² = V_i/252 and the window's total log change
+    x, the daily returns are jointly Gaussian, so the expected realized
+    variance (np.std with ddof=0, annualized) has the closed form
+
+        252/T [S - Q/S + T m² + 2 m d + d² Q/S²] - 252 (x/T)²
+
+    with S = Σ s_i², Q = Σ s_i⁴, m = μ/252 and d = x - T m. Using C = σ² - E[σ² | V, x]
+    as a control variate (zero mean in every z-bin, since z is a function of x)
+    the optimal coefficient is 1, i.e. σ² is replaced by this expectation.
+    Mean reversion is ignored, which is negligible at the default rate.
+
+    Parameters
+    ----------
+    log_prices_daily : ndarray, shape (n_days+1,)
+    V_daily : ndarray, shape (n_days,)
+    T, end : ndarray of int
+        Horizon and index of the last daily return of each window, as returned
+        by window_engine.window_arrays (or the T and date columns of compute_windows).
+    mu : float
+        Drift per year.
+    """
+    T = np.asarray(T)
+    end = np.asarray(end)
+    start = end - T + 1
+    s2 = V_daily / 252.0
+    cs1 = np.concatenate([[0.0], np.cumsum(s2)])
+    cs2 = np.concatenate([[0.0], np.cumsum(s2**2)])
+    S = cs1[end + 1] - cs1[start]
+    Q = cs2[end + 1] - cs2[start]
+    x = log_prices_daily[end + 1] - log_prices_daily[start]
+    m = mu / 252.0
+    d = x - T * m
+    return 252.0 / T * (S - Q/S + T*m**2 + 2*m*d + d**2 * Q / S**2) - 252.0 * (x / T)**2
+
+
+def simulate_qvar_windows(sigma0, mu=0.0, n_days=5_000_000, samples_per_day=4,
+                          max_window_days=130, mean_reversion_rate=0.001, seed=None,
+                          antithetic=False, control_variate=False, stratified_regimes=False,
+                          horizons=None):
+    """
+    Simulate the regime mixture model and return its windows, with optional
+    variance reduction for the binned q-variance curve.
+
+    Parameters
+    ----------
+    sigma0, mu, n_days, samples_per_day, max_window_days, mean_reversion_rate, seed,
+    stratified_regimes :
+        As in simulate_regime_mixture_qvar.
+    antithetic : bool
+        Add the windows of the antithetic path (same regimes, negated draws).
+        Its binned curve is the mirror image in z, so the pair averages out
+        the odd part of the Monte Carlo noise at the cost of one extra window pass.
+    control_variate : bool
+        Add a var_cv column holding E[σ² | regime variances, x] (see
+        expected_window_variance); bin var_cv instead of sigma² to remove the
+        within-window sampling noise of the realized variance.
+    horizons : array-like of int or None
+        Window lengths, the challenge's HORIZONS by default.
+
+    Returns
+    -------
+    windows : DataFrame
+        Columns ticker, date, T, sigma, z (and var_cv). Dates of the
+        antithetic path are offset by n_days.
+    """
+    _use_challenge_code()
+    from window_engine import HORIZONS, compute_windows
+    if horizons is None:
+        horizons = HORIZONS
+
+    prices, L_daily, V_daily = simulate_regime_mixture_qvar(
+        sigma0=sigma0,
+        mu=mu,
+        n_days=n_days,
+        samples_per_day=samples_per_day,
+        max_window_days=max_window_days,
+        mean_reversion_rate=mean_reversion_rate,
+        seed=seed,
+        antithetic=antithetic,
+        stratified_regimes=stratified_regimes,
+    )
+
+    frames = []
+    for j, (p, L) in enumerate(zip(np.atleast_2d(prices), np.atleast_2d(L_daily))):
+        w = compute_windows(p, horizons=horizons)
+        if control_variate:
+            w["var_cv"] = expected_window_variance(L, V_daily, w["T"].to_numpy(),
+                                                   w["date"].to_numpy(), mu)
+        w["date"] += j * n_days
+        frames.append(w)
+    return pd.concat(frames, ignore_index=True)
+
+
+def binned_variance_curve(windows, column="var_cv"):
+    """
+    Binned q-variance curve with per-bin standard errors.
+
+    column is "var_cv" for the control-variate estimate, or "var" for the
+    plain realized variance sigma².
+    """
+    _use_challenge_code()
+    from qvar_bins import BinAccumulator
+
+    var = windows["sigma"].to_numpy()**2 if column == "var" else windows[column].to_numpy()
+    return BinAccumulator().update(windows["z"].to_numpy(), var).binned()
+
+
+def expected_qvar_curve(sigma0, mu=0.0, mean_regime_length_days=None, max_window_days=130,
+                        horizons=None, bins=None, finite_regime_correction=True, n_quad=24):
+    """
+    Expected binned q-variance curve of the regime mixture model, without simulating.
+
+    Long-regime limit: a window lies inside one regime, so z | V ~ N(0, V)
+    after de-meaning and V ~ InvGamma(3/2, scale=σ₀²). Then z is Student-t
+    (3 dof, scale σ₀·sqrt(2/3)), E[V | z] = σ₀² + z²/2 exactly, and the realized
+    (ddof=0) variance has E[σ² | V, z] = (T-1)/T · V. Bin averages of this are
+    done by quadrature on the t density.
+
+    Finite-regime correction: a T-day window contains a regime switch with
+    probability p_T = 1 - (1 - 1/ℓ)^T for mean regime length ℓ days. Such
+    windows are treated as exactly one switch at a uniform position f, with
+    V̄ = f V₁ + (1-f) V₂ and W = f V₁² + (1-f) V₂², where
+
+        E[σ² | V₁, V₂, f, z] = V̄ - W/(T V̄) + z²/T · (W/V̄² - 1)
+
+    and the expectation over (V₁, V₂, f) is done by Gauss-Legendre quadrature
+    in the quantiles of V. Horizons are pooled with weights ∝ 1/T, the number
+    of windows each contributes.
+
+    The drift μ drops out: z is de-meaned per horizon. Mean reversion and
+    windows with two or more switches are neglected.
+
+    Parameters
+    ----------
+    sigma0 : float
+        Baseline variance scale.
+    mu : float
+        Drift per year (no effect on the de-meaned curve, kept for symmetry
+        with simulate_regime_mixture_qvar).
+    mean_regime_length_days, max_window_days :
+        As in simulate_regime_mixture_qvar (ℓ = 10 * max_window_days if not given).
+    horizons : array-like of int or None
+        Window lengths, the challenge's HORIZONS by default.
+    bins : array-like or None
+        z-bin edges, the scorer's by default.
+    finite_regime_correction : bool
+        Include the regime-switch term; False gives the long-regime limit.
+    n_quad : int
+        Quadrature nodes per bin and per regime variance (8 are used for f).
+
+    Returns
+    -------
+    binned : DataFrame
+        z_mid and var per bin, in the format of the scorers' binned table.
+    """
+    from scipy.special import roots_legendre
+    from scipy.stats import invgamma, norm, t as student_t
+    _use_challenge_code()
+    from qvar_bins import BINS
+    from window_engine import HORIZONS
+    if horizons is None:
+        horizons = HORIZONS
+    if bins is None:
+        bins = BINS
+
+    if mean_regime_length_days is None:
+        mean_regime_length_days = 10.0 * max_window_days if max_window_days is not None else 2000.0
+    alpha, beta = 3/2, sigma0**2
+    bins = np.asarray(bins, dtype=float)
+    a, b = bins[:-1], bins[1:]
+    T = np.asarray(horizons, dtype=float)
+    w_T = (1.0 / T) / np.sum(1.0 / T)
+
+    # --- long-regime limit: z ~ Student-t, E[V | z] = (β + z²/2)/(α - 1/2) ---
+    tdist = student_t(df=2*alpha, scale=np.sqrt(beta / alpha))
+    x, wx = roots_legendre(n_quad)
+    zq = (a[:, None] + b[:, None]) / 2 + (b - a)[:, None] / 2 * x       # nodes per bin
+    dens = tdist.pdf(zq) * (b - a)[:, None] / 2 * wx
+    P0 = dens.sum(axis=1)
+    Z0 = (zq * dens).sum(axis=1)
+    S0 = ((beta + zq**2 / 2) / (alpha - 0.5) * dens).sum(axis=1)        # E[V 1_bin]
+
+    P = np.zeros_like(P0)
+    Z = np.zeros_like(P0)
+    S = np.zeros_like(P0)
+    p_T = 1 - (1 - 1/mean_regime_length_days)**T if finite_regime_correction else np.zeros_like(T)
+    for wt, Tk, pk in zip(w_T, T, p_T):
+        P += wt * (1 - pk) * P0
+        Z += wt * (1 - pk) * Z0
+        S += wt * (1 - pk) * (Tk - 1) / Tk * S0
+
+    if finite_regime_correction:
+        # --- one switch: quadrature over quantiles of V₁, V₂ and the split f ---
+        # u = 1 - (1-s)³ clusters the V nodes in the heavy tail, where the
+        # integrand behaves like (1-u)^(-1/3) and plain Gauss-Legendre converges slowly
+        sq = (x + 1) / 2
+        u = 1 - (1 - sq)**3
+        Vq = invgamma.ppf(u, alpha, scale=beta)
+        wv = wx / 2 * 3 * (1 - sq)**2
+        xf, wf = roots_legendre(8)
+        fq, wf = (xf + 1) / 2, wf / 2
+        V1, V2, f = np.meshgrid(Vq, Vq, fq, indexing='ij')
+        wq = (wv[:, None, None] * wv[None, :, None] * wf[None, None, :]).ravel()
+        V1, V2, f = V1.ravel(), V2.ravel(), f.ravel()
+        Vbar = f*V1 + (1 - f)*V2
+        W = f*V1**2 + (1 - f)*V2**2
+        sd = np.sqrt(Vbar)
+
+        lo, hi = a[:, None] / sd, b[:, None] / sd
+        phl, phh = norm.pdf(lo), norm.pdf(hi)
+        P1 = norm.cdf(hi) - norm.cdf(lo)                                 # P(z in bin | V)
+        Z1 = sd * (phl - phh)                                            # E[z 1_bin | V]
+        Z2 = Vbar * (P1 - (hi*phh - lo*phl))                             # E[z² 1_bin | V]
+        P1w = P1 @ wq
+        Z1w = Z1 @ wq
+        A1 = (Vbar * P1) @ wq                                            # T-free part
+        B1 = (W / Vbar * P1 - (W / Vbar**2 - 1) * Z2) @ wq               # coefficient of -1/T
+        for wt, Tk, pk in zip(w_T, T, p_T):
+            P += wt * pk * P1w
+            Z += wt * pk * Z1w
+            S += wt * pk * (A1 - B1 / Tk)
+
+    ok = P > 0
+    return pd.DataFrame({"z_mid": Z[ok] / P[ok], "var": S[ok] / P[ok]})
+
+
+def expected_qvar_r2(sigma0, mu=0.0, mean_regime_length_days=None, max_window_days=130,
+                     horizons=None, popt=None, **kwargs):
+    """R² of expected_qvar_curve against the q-variance curve (baseline fit by default)"""
+    _use_challenge_code()
+    from qvar_bins import BASELINE_POPT, r2_score_binned
+    if popt is None:
+        popt = BASELINE_POPT
+    binned = expected_qvar_curve(sigma0, mu, mean_regime_length_days, max_window_days,
+                                 horizons, **kwargs)
+    return float(r2_score_binned(binned, popt))
+
+
 def generate_price_csv(sigma0, mu=0.0, n_days=5_000_000, samples_per_day=4,
                        max_window_days=130, output_file='variance_timeseries.csv',
                        mean_reversion_rate=0.001, seed=None):